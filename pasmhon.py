@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
-import sys, re, os, stat, subprocess
-from dataclasses import dataclass
+import sys, re, os, stat, mmap, struct, operator
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+from typing import Any, Callable, cast
 
 # =========================
 # ELF backend
@@ -10,70 +12,80 @@ BASE   = 0x400000
 CODEVA = BASE + 0x80
 DATAVA = BASE + 0x100
 
+# write(1, msg, len); exit(0) -- the two immediates are patched per build
+_PRINT_TEMPLATE = bytes.fromhex(
+    "48c7c001000000"        # mov rax,1
+    "48c7c701000000"        # mov rdi,1
+    "48be" + "00" * 8 +     # mov rsi,msg (64 bit absolute address)
+    "48c7c2" + "00" * 4 +   # mov rdx,len
+    "0f05"                  # syscall
+    "48c7c03c000000"        # mov rax,60
+    "4831ff"                # xor rdi,rdi
+    "0f05"                  # syscall
+)
+_PRINT_MSG_OFF = 16
+_PRINT_LEN_OFF = 27
+
 def build_print(msg):
-    code = []
-    # write(1, msg, len)
-    code += [0x48,0xc7,0xc0,1,0,0,0]                     # mov rax,1
-    code += [0x48,0xc7,0xc7,1,0,0,0]                     # mov rdi,1
-    # correct 64 bit absolute address for rsi
-    code += [0x48,0xbe] + list(DATAVA.to_bytes(8, 'little'))      # mov rsi,msg
-    code += [0x48,0xc7,0xc2] + list(len(msg).to_bytes(4,'little'))  # mov rdx,len
-    code += [0x0f,0x05]                                  # syscall
-    # exit(0)
-    code += [0x48,0xc7,0xc0,60,0,0,0]                    # mov rax,60
-    code += [0x48,0x31,0xff]                             # xor rdi,rdi
-    code += [0x0f,0x05]                                  # syscall
-    return bytes(code)
-
-def elf64(code, data):
+    buf = bytearray(_PRINT_TEMPLATE)
+    struct.pack_into("<Q", buf, _PRINT_MSG_OFF, DATAVA)
+    struct.pack_into("<I", buf, _PRINT_LEN_OFF, len(msg))
+    return bytes(buf)
+
+def elf64_size(data):
+    return 0x100 + len(data)
+
+def _elf64_headers(buf, file_size):
     # ELF header
-    eh = bytearray()
-    eh += b"\x7fELF"
-    eh += b"\x02"
-    eh += b"\x01"
-    eh += b"\x01"
-    eh += b"\x00"*9
-    eh += (2).to_bytes(2,'little')      # type EXEC
-    eh += (0x3e).to_bytes(2,'little')   # machine x86_64
-    eh += (1).to_bytes(4,'little')      # version
-    eh += CODEVA.to_bytes(8,'little')   # entry point
-    eh += (64).to_bytes(8,'little')     # program header offset
-    eh += (0).to_bytes(8,'little')      # section header offset
-    eh += (0).to_bytes(4,'little')      # flags
-    eh += (64).to_bytes(2,'little')     # ELF header size
-    eh += (56).to_bytes(2,'little')     # PH entry size
-    eh += (1).to_bytes(2,'little')      # PH count
-    eh += (0).to_bytes(2,'little')      # SH entry size
-    eh += (0).to_bytes(2,'little')      # SH count
-    eh += (0).to_bytes(2,'little')      # SH string index
+    buf[0:4] = b"\x7fELF"
+    buf[4] = 2                          # 64 bit
+    buf[5] = 1                          # little endian
+    buf[6] = 1                          # ELF version
+    struct.pack_into(
+        "<HHIQQQIHHHHHH", buf, 16,
+        2,                              # type EXEC
+        0x3e,                           # machine x86_64
+        1,                              # version
+        CODEVA,                         # entry point
+        64,                             # program header offset
+        0,                              # section header offset
+        0,                              # flags
+        64,                             # ELF header size
+        56,                             # PH entry size
+        1,                              # PH count
+        0,                              # SH entry size
+        0,                              # SH count
+        0,                              # SH string index
+    )
 
     # Program header
-    ph = bytearray()
-    ph += (1).to_bytes(4,'little')           # PT_LOAD
-    ph += (5).to_bytes(4,'little')           # PF_R | PF_X
-    ph += (0).to_bytes(8,'little')           # file offset
-    ph += BASE.to_bytes(8,'little')          # vaddr
-    ph += BASE.to_bytes(8,'little')          # paddr
-    file_size = 0x100 + len(data)
-    ph += file_size.to_bytes(8,'little')     # file size
-    ph += file_size.to_bytes(8,'little')     # mem size
-    ph += (0x1000).to_bytes(8,'little')      # alignment
-
-    # pad headers to 0x80 where code begins
-    while len(eh) + len(ph) < 0x80:
-        ph += b"\x00"
-
-    blob = bytearray()
-    blob += eh
-    blob += ph
-    blob += code
-
-    # pad to 0x100 where data begins
-    while len(blob) < 0x100:
-        blob += b"\x00"
-
-    blob += data
-    return blob
+    struct.pack_into(
+        "<IIQQQQQQ", buf, 64,
+        1,                              # PT_LOAD
+        5,                              # PF_R | PF_X
+        0,                              # file offset
+        BASE,                           # vaddr
+        BASE,                           # paddr
+        file_size,                      # file size
+        file_size,                      # mem size
+        0x1000,                         # alignment
+    )
+
+# the headers only depend on file_size, so they are built once and the
+# two size fields of the program header are patched per image
+_skeleton = bytearray(0x80)
+_elf64_headers(_skeleton, 0)
+_ELF_SKELETON = bytes(_skeleton)
+_PH_FILESZ_OFF = 64 + 32
+
+def elf64_into(buf, code, data):
+    # buf is any zero filled writable buffer of elf64_size(data) bytes, so
+    # the padding up to 0x80 (code) and 0x100 (data) is already there
+    file_size = elf64_size(data)
+    buf[0:0x80] = _ELF_SKELETON
+    struct.pack_into("<QQ", buf, _PH_FILESZ_OFF, file_size, file_size)
+    buf[0x80:0x80 + len(code)] = code
+    buf[0x100:] = data
 
 # =========================
 # Global config for types / JIT / imports
@@ -87,16 +99,20 @@ TYPE_MAP = {
 }
 
 JIT_THRESHOLD = 10
-MODULE_CACHE = {}
+MODULE_CACHE: dict[str, "ModuleObject"] = {}
+
+# memoize parse_expr by token index (--packrat), for deeply nested input
+PACKRAT = False
 
-# global output buffer pointer used inside function calls
-CURRENT_OUT = None
+# global output buffer (utf-8 bytearray) used inside function calls; swapped
+# in by run_program and import_module
+CURRENT_OUT = bytearray()
 
 # =========================
 # Lexer
 # =========================
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     type: str
     value: object
@@ -124,284 +140,305 @@ KEYWORDS = {
     "async":    "ASYNC",
     "await":    "AWAIT",
 }
+KEYWORDS = {k: sys.intern(v) for k, v in KEYWORDS.items()}
 
 def strip_block_comments(src):
     # remove /* ... */ including multiline blocks
     return re.sub(r'/\*.*?\*/', '', src, flags=re.S)
 
+TWO_CHAR_OPS = {
+    "==": "EQEQ",
+    "!=": "NE",
+    "<=": "LE",
+    ">=": "GE",
+}
+
+SINGLE_CHAR_OPS = {
+    "+": "PLUS",
+    "-": "MINUS",
+    "*": "STAR",
+    "/": "SLASH",
+    "%": "MOD",
+    "(": "LPAREN",
+    ")": "RPAREN",
+    ":": "COLON",
+    ",": "COMMA",
+    "<": "LT",
+    ">": "GT",
+    "=": "EQ",
+    "[": "LBRACK",
+    "]": "RBRACK",
+    "{": "LBRACE",
+    "}": "RBRACE",
+    ".": "DOT",
+}
+
+# tokens are never mutated, so fixed-text tokens are built once and shared
+KEYWORD_TOKENS  = {k: Token(v, k) for k, v in KEYWORDS.items()}
+TWO_CHAR_TOKENS = {k: Token(sys.intern(v), k) for k, v in TWO_CHAR_OPS.items()}
+SINGLE_TOKENS   = {k: Token(sys.intern(v), k) for k, v in SINGLE_CHAR_OPS.items()}
+NEWLINE_TOKEN   = Token("NEWLINE", None)
+INDENT_TOKEN    = Token("INDENT", None)
+DEDENT_TOKEN    = Token("DEDENT", None)
+EOF_TOKEN       = Token("EOF", None)
+
+# one alternation per token class, tried in order at the current position
+TOKEN_RE = re.compile(r"""
+    (?P<WS>[ \t]+)
+  | (?P<COMMENT>\#.*)
+  | (?P<INT>\d+)
+  | (?P<IDENT>[^\W\d]\w*)
+  | (?P<STRING>"(?:[^"\\]|\\.)*")
+  | (?P<OP2>==|!=|<=|>=)
+  | (?P<OP1>[-+*/%():,<>=\[\]{}.])
+""", re.X)
+
+# longest prefix of an unterminated string, used only to pick the error
+STRING_PREFIX_RE = re.compile(r'"(?:[^"\\]|\\.)*')
+
+_ESCAPE_RE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)")
+_SIMPLE_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+def _decode_escape(m, tail):
+    esc = m.group(1)
+    if len(esc) == 5:
+        return chr(int(esc[1:], 16))
+    if esc == "u":
+        # "incomplete" means the source line, not just the string, runs out
+        # before four hex digits could follow
+        if m.end() + 4 > len(m.string) + tail:
+            raise SyntaxError("incomplete unicode escape")
+        raise SyntaxError("invalid unicode escape")
+    # \" and \\ (and any unknown escape) stand for the character itself
+    return _SIMPLE_ESCAPES.get(esc, esc)
+
+def decode_string(body, tail=1):
+    # tail is how many characters of the line follow body, closing quote
+    # included
+    if "\\" not in body:
+        return body
+    return _ESCAPE_RE.sub(lambda m: _decode_escape(m, tail), body)
+
 def lex_line(line):
     tokens = []
-    i = 0
+    pos = 0
     n = len(line)
-    while i < n:
-        c = line[i]
-        if c in " \t":
-            i += 1
-            continue
-        if c == "#":
-            break
-        if c.isdigit():
-            start = i
-            while i < n and line[i].isdigit():
-                i += 1
-            tokens.append(Token("INT", int(line[start:i])))
-            continue
-        if c.isalpha() or c == "_":
-            start = i
-            while i < n and (line[i].isalnum() or line[i] == "_"):
-                i += 1
-            ident = line[start:i]
-            ttype = KEYWORDS.get(ident, "IDENT")
-            tokens.append(Token(ttype, ident))
-            continue
-        if c == '"':
-            i += 1
-            buf = []
-            while i < n:
-                ch = line[i]
-                if ch == '"':
-                    i += 1
-                    break
-                if ch == "\\":
-                    i += 1
-                    if i >= n:
-                        raise SyntaxError("unterminated string escape")
-                    esc = line[i]
-                    if esc == "n":
-                        buf.append("\n")
-                    elif esc == "t":
-                        buf.append("\t")
-                    elif esc == "r":
-                        buf.append("\r")
-                    elif esc == '"':
-                        buf.append('"')
-                    elif esc == "\\":
-                        buf.append("\\")
-                    elif esc == "u":
-                        if i + 4 >= n:
-                            raise SyntaxError("incomplete unicode escape")
-                        hex_digits = line[i+1:i+5]
-                        if not all(ch2 in "0123456789abcdefABCDEF" for ch2 in hex_digits):
-                            raise SyntaxError("invalid unicode escape")
-                        codepoint = int(hex_digits, 16)
-                        buf.append(chr(codepoint))
-                        i += 4
-                    else:
-                        buf.append(esc)
-                    i += 1
-                    continue
-                buf.append(ch)
-                i += 1
-            else:
+    match = TOKEN_RE.match
+    while pos < n:
+        m = match(line, pos)
+        if m is None:
+            if line[pos] == '"':
+                end = STRING_PREFIX_RE.match(line, pos).end()
+                # a bad escape before the end of the line is reported first
+                decode_string(line[pos + 1:end], n - end)
+                if end < n:
+                    raise SyntaxError("unterminated string escape")
                 raise SyntaxError("unterminated string")
-            tokens.append(Token("STRING", "".join(buf)))
-            continue
-        if c in "=!<>" and i + 1 < n and line[i+1] == "=":
-            two = c + "="
-            ttype = {
-                "==": "EQEQ",
-                "!=": "NE",
-                "<=": "LE",
-                ">=": "GE",
-            }[two]
-            tokens.append(Token(ttype, two))
-            i += 2
-            continue
-
-        single = {
-            "+": "PLUS",
-            "-": "MINUS",
-            "*": "STAR",
-            "/": "SLASH",
-            "%": "MOD",
-            "(": "LPAREN",
-            ")": "RPAREN",
-            ":": "COLON",
-            ",": "COMMA",
-            "<": "LT",
-            ">": "GT",
-            "=": "EQ",
-            "[": "LBRACK",
-            "]": "RBRACK",
-            "{": "LBRACE",
-            "}": "RBRACE",
-            ".": "DOT",
-        }
-
-        if c in single:
-            tokens.append(Token(single[c], c))
-            i += 1
+            raise SyntaxError(f"unexpected character {line[pos]!r}")
+        kind = m.lastgroup
+        pos = m.end()
+        if kind == "WS":
             continue
-        raise SyntaxError(f"unexpected character {c!r}")
+        if kind == "COMMENT":
+            break
+        text = m.group()
+        if kind == "INT":
+            tokens.append(Token("INT", int(text)))
+        elif kind == "IDENT":
+            tok = KEYWORD_TOKENS.get(text)
+            # interned so every env/class dict lookup by this name compares
+            # by identity instead of hashing and comparing fresh strings
+            tokens.append(tok if tok is not None else Token("IDENT", sys.intern(text)))
+        elif kind == "STRING":
+            tokens.append(Token("STRING", decode_string(text[1:-1], n - pos + 1)))
+        elif kind == "OP2":
+            tokens.append(TWO_CHAR_TOKENS[text])
+        else:
+            tokens.append(SINGLE_TOKENS[text])
     return tokens
 
+@lru_cache(maxsize=4096)
+def lex_line_cached(line):
+    # tokens are never mutated, so repeated lines can share one token tuple
+    return tuple(lex_line(line))
+
 def lex(src):
     src = strip_block_comments(src)
     tokens = []
     indents = [0]
-    for raw in src.splitlines():
-        line = raw.rstrip("\r\n")
-        if not line.strip() or line.lstrip().startswith("#"):
-            continue
+    for line in src.splitlines():
         stripped = line.lstrip(" ")
+        if not stripped or stripped[0] == "#":
+            continue
+        if stripped[0].isspace():
+            # other leading whitespace (tabs): blank/comment check on the rest
+            rest = stripped.lstrip()
+            if not rest or rest[0] == "#":
+                continue
         indent = len(line) - len(stripped)
         if indent > indents[-1]:
             indents.append(indent)
-            tokens.append(Token("INDENT", None))
+            tokens.append(INDENT_TOKEN)
         elif indent < indents[-1]:
             while indent < indents[-1]:
                 indents.pop()
-                tokens.append(Token("DEDENT", None))
+                tokens.append(DEDENT_TOKEN)
             if indent != indents[-1]:
                 raise SyntaxError("inconsistent indentation")
-        tokens.extend(lex_line(stripped))
-        tokens.append(Token("NEWLINE", None))
+        tokens.extend(lex_line_cached(stripped))
+        tokens.append(NEWLINE_TOKEN)
     while len(indents) > 1:
         indents.pop()
-        tokens.append(Token("DEDENT", None))
-    tokens.append(Token("EOF", None))
+        tokens.append(DEDENT_TOKEN)
+    tokens.append(EOF_TOKEN)
     return tokens
 
 # =========================
 # AST nodes
 # =========================
 
-@dataclass
+@dataclass(slots=True)
 class Program:
-    stmts: list
+    stmts: tuple
 
 # statements
-@dataclass
+@dataclass(slots=True)
 class Assign:
     name: str
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class AttrAssign:
     obj: object
     name: str
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class IndexAssign:
     seq: object
     index: object
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class PrintStmt:
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class IfStmt:
     cond: object
-    body: list
+    body: tuple
 
-@dataclass
+@dataclass(slots=True)
 class WhileStmt:
     cond: object
-    body: list
+    body: tuple
 
-@dataclass
+@dataclass(slots=True)
 class ForStmt:
     var: str
     iterable: object
-    body: list
+    body: tuple
 
-@dataclass
+@dataclass(slots=True)
 class ClassDef:
     name: str
     base_name: str | None
-    body: list
+    body: tuple
 
-@dataclass
+@dataclass(slots=True)
 class FuncDef:
     name: str
     params: list
     annotations: dict
-    body: list
+    body: tuple
     defaults: dict | None = None
     vararg: str | None = None
     is_async: bool = False
 
-@dataclass
+@dataclass(slots=True)
 class ReturnStmt:
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class YieldStmt:
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class BreakStmt:
     pass
 
-@dataclass
+@dataclass(slots=True)
 class ContinueStmt:
     pass
 
-@dataclass
+@dataclass(slots=True)
 class ExprStmt:
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class TryStmt:
-    body: list
-    handler: list
+    body: tuple
+    handler: tuple
 
-@dataclass
+@dataclass(slots=True)
 class RaiseStmt:
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class NonlocalStmt:
     names: list
 
-@dataclass
+@dataclass(slots=True)
 class ImportStmt:
     module: str
 
-@dataclass
+@dataclass(slots=True)
 class WithStmt:
     expr: object
     var: str | None
-    body: list
+    body: tuple
 
 # expressions
-@dataclass
+@dataclass(slots=True)
 class IntLit:
     value: int
 
-@dataclass
+@dataclass(slots=True)
 class StringLit:
     value: str
 
-@dataclass
+@dataclass(slots=True)
 class Var:
     name: str
 
-@dataclass
+@dataclass(slots=True)
 class BinOp:
     op: str
     left: object
     right: object
+    fn: object = field(default=None, repr=False, compare=False)   # BINOP_FUNCS[op], bound by the parser
+
+@dataclass(slots=True)
+class UnaryOp:
+    op: str
+    operand: object
 
-@dataclass
+@dataclass(slots=True)
 class ListLit:
     elements: list
 
-@dataclass
+@dataclass(slots=True)
 class ListComp:
     expr: object
     var: str
     iterable: object
     cond: object | None
 
-@dataclass
+@dataclass(slots=True)
 class DictLit:
     items: list   # list of (key_expr, value_expr)
 
-@dataclass
+@dataclass(slots=True)
 class DictComp:
     key_expr: object
     value_expr: object
@@ -409,46 +446,46 @@ class DictComp:
     iterable: object
     cond: object | None
 
-@dataclass
+@dataclass(slots=True)
 class GenExpr:
     expr: object
     var: str
     iterable: object
     cond: object | None
 
-@dataclass
+@dataclass(slots=True)
 class Index:
     seq: object
     index: object
 
-@dataclass
+@dataclass(slots=True)
 class SliceIndex:
     seq: object
     start: object | None
     stop: object | None
     step: object | None
 
-@dataclass
+@dataclass(slots=True)
 class Attr:
     obj: object
     name: str
 
-@dataclass
+@dataclass(slots=True)
 class LambdaExpr:
-    params: list
+    params: tuple[list[str], dict[str, object]]    # names, defaults
     body: object
 
-@dataclass
+@dataclass(slots=True)
 class AwaitExpr:
     expr: object
 
-@dataclass
+@dataclass(slots=True)
 class Call:
     name: str
     args: list
     kwargs: list   # list of (name, expr)
 
-@dataclass
+@dataclass(slots=True)
 class MethodCall:
     obj: object
     name: str
@@ -459,78 +496,83 @@ class MethodCall:
 # Parser
 # =========================
 
+# token type -> (precedence, operator); every binary operator is left
+# associative, higher precedence binds tighter
+BINARY_OPS = {
+    "EQEQ":  (1, "=="),
+    "NE":    (1, "!="),
+    "LT":    (2, "<"),
+    "GT":    (2, ">"),
+    "LE":    (2, "<="),
+    "GE":    (2, ">="),
+    "PLUS":  (3, "+"),
+    "MINUS": (3, "-"),
+    "STAR":  (4, "*"),
+    "SLASH": (4, "/"),
+    "MOD":   (4, "%"),
+}
+
+# token types that end an indented block / an empty slice stop
+BLOCK_END      = frozenset({"DEDENT", "EOF"})
+SLICE_STOP_END = frozenset({"RBRACK", "COLON"})
+
 class Parser:
-    def __init__(self, tokens):
+    __slots__ = ("tokens", "i", "cur", "memo", "fold")
+    tokens: list[Token]
+    i: int
+    cur: Token
+    memo: dict[int, tuple[object, int]] | None
+    fold: bool
+
+    def __init__(self, tokens: list[Token], memoize: bool = False, fold: bool = True) -> None:
         self.tokens = tokens
         self.i = 0
-
-    @property
-    def cur(self):
-        return self.tokens[self.i]
-
-    def peek(self):
+        # always tokens[i]: every place that moves i refreshes it
+        self.cur = tokens[0]
+        # packrat cache for parse_expr, start index -> (node, end index).
+        # The grammar never backtracks today, so it is off by default
+        self.memo = {} if memoize else None
+        # fold literal-only binary ops as they are built (see fold_binop);
+        # fold=False keeps the tree as written, for debugging the parser
+        self.fold = fold
+
+    def peek(self) -> Token:
         if self.i + 1 < len(self.tokens):
             return self.tokens[self.i+1]
-        return Token("EOF", None)
+        return EOF_TOKEN
 
-    def eat(self, ttype):
+    def eat(self, ttype: str) -> None:
         if self.cur.type != ttype:
             raise SyntaxError(f"expected {ttype}, got {self.cur.type}")
-        self.i += 1
+        i = self.i + 1
+        self.i = i
+        self.cur = self.tokens[i]
 
-    def parse_program(self):
+    def parse_program(self) -> Program:
         stmts = []
-        while self.cur.type != "EOF":
-            if self.cur.type in ("NEWLINE", "DEDENT"):
-                self.eat(self.cur.type)
+        while True:
+            ttype = self.cur.type
+            if ttype == "EOF":
+                break
+            if ttype == "NEWLINE" or ttype == "DEDENT":
+                self.eat(ttype)
                 continue
             stmts.append(self.parse_stmt())
-        return Program(stmts)
-
-    def parse_stmt(self):
-        if self.cur.type == "CLASS":
-            return self.parse_classdef()
-        if self.cur.type == "TRY":
-            return self.parse_try()
-        if self.cur.type == "IMPORT":
-            return self.parse_import()
-        if self.cur.type == "WITH":
-            return self.parse_with()
-        if self.cur.type == "ASYNC":
-            self.eat("ASYNC")
-            if self.cur.type != "DEF":
-                raise SyntaxError("expected 'def' after 'async'")
-            return self.parse_funcdef(is_async=True)
-        if self.cur.type == "IF":
-            return self.parse_if()
-        if self.cur.type == "WHILE":
-            return self.parse_while()
-        if self.cur.type == "FOR":
-            return self.parse_for()
-        if self.cur.type == "DEF":
-            return self.parse_funcdef(is_async=False)
+        return Program(tuple(stmts))
+
+    def parse_stmt(self) -> object:
+        handler = STMT_PARSERS.get(self.cur.type)
+        if handler is not None:
+            return handler(self)
         node = self.parse_simple_stmt()
         if self.cur.type == "NEWLINE":
             self.eat("NEWLINE")
         return node
 
-    def parse_simple_stmt(self):
-        if self.cur.type == "PRINT":
-            return self.parse_print()
-        if self.cur.type == "RETURN":
-            return self.parse_return()
-        if self.cur.type == "YIELD":
-            return self.parse_yield()
-        if self.cur.type == "BREAK":
-            self.eat("BREAK")
-            return BreakStmt()
-        if self.cur.type == "CONTINUE":
-            self.eat("CONTINUE")
-            return ContinueStmt()
-        if self.cur.type == "NONLOCAL":
-            return self.parse_nonlocal()
-        if self.cur.type == "RAISE":
-            return self.parse_raise()
+    def parse_simple_stmt(self) -> object:
+        handler = SIMPLE_STMT_PARSERS.get(self.cur.type)
+        if handler is not None:
+            return handler(self)
 
         expr = self.parse_expr()
         if self.cur.type == "EQ" and isinstance(expr, (Var, Attr, Index)):
@@ -544,101 +586,118 @@ class Parser:
                 return IndexAssign(expr.seq, expr.index, value)
         return ExprStmt(expr)
 
-    def parse_print(self):
+    def parse_block(self) -> tuple:
+        # the body after a ':' -- an indented suite or one simple statement
+        body = []
+        if self.cur.type == "NEWLINE":
+            self.eat("NEWLINE")
+            self.eat("INDENT")
+            while self.cur.type not in BLOCK_END:
+                body.append(self.parse_stmt())
+            self.eat("DEDENT")
+        else:
+            body.append(self.parse_simple_stmt())
+            if self.cur.type == "NEWLINE":
+                self.eat("NEWLINE")
+        # bodies are never mutated after parsing
+        return tuple(body)
+
+    def parse_delimited(self, end_type: str, parse_item: Callable[[], object], items: list | None = None) -> list:
+        # comma separated items up to end_type (eaten), a trailing comma is
+        # allowed. Pass items to carry on after ones the caller already has
+        if items is None:
+            items = []
+            if self.cur.type == end_type:
+                self.eat(end_type)
+                return items
+            items.append(parse_item())
+        while self.cur.type == "COMMA":
+            self.eat("COMMA")
+            if self.cur.type == end_type:
+                break
+            items.append(parse_item())
+        self.eat(end_type)
+        return items
+
+    def parse_async(self) -> FuncDef:
+        self.eat("ASYNC")
+        if self.cur.type != "DEF":
+            raise SyntaxError("expected 'def' after 'async'")
+        return self.parse_funcdef(is_async=True)
+
+    def parse_break(self) -> BreakStmt:
+        self.eat("BREAK")
+        return BreakStmt()
+
+    def parse_continue(self) -> ContinueStmt:
+        self.eat("CONTINUE")
+        return ContinueStmt()
+
+    def parse_print(self) -> PrintStmt:
         self.eat("PRINT")
         self.eat("LPAREN")
         expr = self.parse_expr()
         self.eat("RPAREN")
         return PrintStmt(expr)
 
-    def parse_classdef(self):
+    def parse_classdef(self) -> ClassDef:
         self.eat("CLASS")
         if self.cur.type != "IDENT":
             raise SyntaxError("expected class name")
-        name = self.cur.value
+        name = cast(str, self.cur.value)
         self.eat("IDENT")
         base_name = None
         if self.cur.type == "LPAREN":
             self.eat("LPAREN")
             if self.cur.type != "IDENT":
                 raise SyntaxError("expected base class name")
-            base_name = self.cur.value
+            base_name = cast(str, self.cur.value)
             self.eat("IDENT")
             self.eat("RPAREN")
         self.eat("COLON")
-        body = []
-        if self.cur.type == "NEWLINE":
-            self.eat("NEWLINE")
-            self.eat("INDENT")
-            while self.cur.type not in ("DEDENT", "EOF"):
-                body.append(self.parse_stmt())
-            self.eat("DEDENT")
-        else:
-            body.append(self.parse_simple_stmt())
-            if self.cur.type == "NEWLINE":
-                self.eat("NEWLINE")
+        body = self.parse_block()
         return ClassDef(name, base_name, body)
 
-    def parse_try(self):
+    def parse_try(self) -> TryStmt:
         self.eat("TRY")
         self.eat("COLON")
-        body = []
-        if self.cur.type == "NEWLINE":
-            self.eat("NEWLINE")
-            self.eat("INDENT")
-            while self.cur.type not in ("DEDENT", "EOF"):
-                body.append(self.parse_stmt())
-            self.eat("DEDENT")
-        else:
-            body.append(self.parse_simple_stmt())
-            if self.cur.type == "NEWLINE":
-                self.eat("NEWLINE")
+        body = self.parse_block()
         if self.cur.type != "EXCEPT":
             raise SyntaxError("expected 'except' after try block")
         self.eat("EXCEPT")
         self.eat("COLON")
-        handler = []
-        if self.cur.type == "NEWLINE":
-            self.eat("NEWLINE")
-            self.eat("INDENT")
-            while self.cur.type not in ("DEDENT", "EOF"):
-                handler.append(self.parse_stmt())
-            self.eat("DEDENT")
-        else:
-            handler.append(self.parse_simple_stmt())
-            if self.cur.type == "NEWLINE":
-                self.eat("NEWLINE")
+        handler = self.parse_block()
         return TryStmt(body, handler)
 
-    def parse_raise(self):
+    def parse_raise(self) -> RaiseStmt:
         self.eat("RAISE")
         expr = self.parse_expr()
         return RaiseStmt(expr)
 
-    def parse_nonlocal(self):
+    def parse_nonlocal(self) -> NonlocalStmt:
         self.eat("NONLOCAL")
         names = []
         if self.cur.type != "IDENT":
             raise SyntaxError("expected name after nonlocal")
-        names.append(self.cur.value)
+        names.append(cast(str, self.cur.value))
         self.eat("IDENT")
         while self.cur.type == "COMMA":
             self.eat("COMMA")
             if self.cur.type != "IDENT":
                 raise SyntaxError("expected name after nonlocal ','")
-            names.append(self.cur.value)
+            names.append(cast(str, self.cur.value))
             self.eat("IDENT")
         return NonlocalStmt(names)
 
-    def parse_import(self):
+    def parse_import(self) -> ImportStmt:
         self.eat("IMPORT")
         if self.cur.type != "IDENT":
             raise SyntaxError("expected module name")
-        name = self.cur.value
+        name = cast(str, self.cur.value)
         self.eat("IDENT")
         return ImportStmt(name)
 
-    def parse_with(self):
+    def parse_with(self) -> WithStmt:
         self.eat("WITH")
         expr = self.parse_expr()
         var_name = None
@@ -646,240 +705,155 @@ class Parser:
             self.eat("AS")
             if self.cur.type != "IDENT":
                 raise SyntaxError("expected name after 'as'")
-            var_name = self.cur.value
+            var_name = cast(str, self.cur.value)
             self.eat("IDENT")
         if self.cur.type != "COLON":
             raise SyntaxError("expected ':' after with header")
         self.eat("COLON")
-        body = []
-        if self.cur.type == "NEWLINE":
-            self.eat("NEWLINE")
-            self.eat("INDENT")
-            while self.cur.type not in ("DEDENT", "EOF"):
-                body.append(self.parse_stmt())
-            self.eat("DEDENT")
-        else:
-            body.append(self.parse_simple_stmt())
-            if self.cur.type == "NEWLINE":
-                self.eat("NEWLINE")
+        body = self.parse_block()
         return WithStmt(expr, var_name, body)
 
-    def parse_if(self):
+    def parse_if(self) -> IfStmt:
         self.eat("IF")
-        cond_tokens = []
-        while self.cur.type not in ("COLON", "EOF"):
-            cond_tokens.append(self.cur)
-            self.i += 1
+        cond = self.parse_expr()
         if self.cur.type != "COLON":
             raise SyntaxError("expected ':' after if condition")
         self.eat("COLON")
-        cond_parser = Parser(cond_tokens + [Token("EOF", None)])
-        cond = cond_parser.parse_expr()
-        body = []
-        if self.cur.type == "NEWLINE":
-            self.eat("NEWLINE")
-            self.eat("INDENT")
-            while self.cur.type not in ("DEDENT", "EOF"):
-                body.append(self.parse_stmt())
-            self.eat("DEDENT")
-        else:
-            body.append(self.parse_simple_stmt())
-            if self.cur.type == "NEWLINE":
-                self.eat("NEWLINE")
+        body = self.parse_block()
         return IfStmt(cond, body)
 
-    def parse_while(self):
+    def parse_while(self) -> WhileStmt:
         self.eat("WHILE")
-        cond_tokens = []
-        while self.cur.type not in ("COLON", "EOF"):
-            cond_tokens.append(self.cur)
-            self.i += 1
+        cond = self.parse_expr()
         if self.cur.type != "COLON":
             raise SyntaxError("expected ':' after while condition")
         self.eat("COLON")
-        cond_parser = Parser(cond_tokens + [Token("EOF", None)])
-        cond = cond_parser.parse_expr()
-        body = []
-        if self.cur.type == "NEWLINE":
-            self.eat("NEWLINE")
-            self.eat("INDENT")
-            while self.cur.type not in ("DEDENT", "EOF"):
-                body.append(self.parse_stmt())
-            self.eat("DEDENT")
-        else:
-            body.append(self.parse_simple_stmt())
-            if self.cur.type == "NEWLINE":
-                self.eat("NEWLINE")
+        body = self.parse_block()
         return WhileStmt(cond, body)
 
-    def parse_for(self):
+    def parse_for(self) -> ForStmt:
         self.eat("FOR")
         if self.cur.type != "IDENT":
             raise SyntaxError("expected loop variable name")
-        var = self.cur.value
+        var = cast(str, self.cur.value)
         self.eat("IDENT")
         if self.cur.type != "IN":
             raise SyntaxError("expected 'in' in for loop")
         self.eat("IN")
-        iter_tokens = []
-        while self.cur.type not in ("COLON", "EOF"):
-            iter_tokens.append(self.cur)
-            self.i += 1
+        iterable = self.parse_expr()
         if self.cur.type != "COLON":
             raise SyntaxError("expected ':' after for iterable")
         self.eat("COLON")
-        iter_parser = Parser(iter_tokens + [Token("EOF", None)])
-        iterable = iter_parser.parse_expr()
-        body = []
-        if self.cur.type == "NEWLINE":
-            self.eat("NEWLINE")
-            self.eat("INDENT")
-            while self.cur.type not in ("DEDENT", "EOF"):
-                body.append(self.parse_stmt())
-            self.eat("DEDENT")
-        else:
-            body.append(self.parse_simple_stmt())
-            if self.cur.type == "NEWLINE":
-                self.eat("NEWLINE")
+        body = self.parse_block()
         return ForStmt(var, iterable, body)
 
-    def parse_funcdef(self, is_async=False):
+    def parse_funcdef(self, is_async: bool = False) -> FuncDef:
         self.eat("DEF")
         if self.cur.type != "IDENT":
             raise SyntaxError("expected function name")
-        name = self.cur.value
+        name = cast(str, self.cur.value)
         self.eat("IDENT")
         self.eat("LPAREN")
         params = []
         annotations = {}
         defaults = {}
         vararg = None
-        if self.cur.type != "RPAREN":
-            while True:
-                if self.cur.type == "STAR":
-                    self.eat("STAR")
-                    if self.cur.type != "IDENT":
-                        raise SyntaxError("expected vararg name after '*'")
-                    if vararg is not None:
-                        raise SyntaxError("multiple *varargs not allowed")
-                    vararg = self.cur.value
-                    self.eat("IDENT")
-                else:
-                    if self.cur.type != "IDENT":
-                        raise SyntaxError("expected parameter name")
-                    pname = self.cur.value
-                    self.eat("IDENT")
-                    ptype = None
-                    if self.cur.type == "COLON":
-                        self.eat("COLON")
-                        if self.cur.type != "IDENT":
-                            raise SyntaxError("expected type name")
-                        ptype = self.cur.value
-                        self.eat("IDENT")
-                    if self.cur.type == "EQ":
-                        self.eat("EQ")
-                        default_expr = self.parse_expr()
-                        defaults[pname] = default_expr
-                    params.append(pname)
-                    if ptype is not None:
-                        annotations[pname] = ptype
-                if self.cur.type != "COMMA":
-                    break
-                self.eat("COMMA")
-                if self.cur.type == "RPAREN":
-                    break
-        self.eat("RPAREN")
+
+        def parse_param() -> None:
+            nonlocal vararg
+            if self.cur.type == "STAR":
+                self.eat("STAR")
+                if self.cur.type != "IDENT":
+                    raise SyntaxError("expected vararg name after '*'")
+                if vararg is not None:
+                    raise SyntaxError("multiple *varargs not allowed")
+                vararg = cast(str, self.cur.value)
+                self.eat("IDENT")
+                return
+            if self.cur.type != "IDENT":
+                raise SyntaxError("expected parameter name")
+            pname = cast(str, self.cur.value)
+            self.eat("IDENT")
+            ptype = None
+            if self.cur.type == "COLON":
+                self.eat("COLON")
+                if self.cur.type != "IDENT":
+                    raise SyntaxError("expected type name")
+                ptype = cast(str, self.cur.value)
+                self.eat("IDENT")
+            if self.cur.type == "EQ":
+                self.eat("EQ")
+                default_expr = self.parse_expr()
+                defaults[pname] = default_expr
+            params.append(pname)
+            if ptype is not None:
+                annotations[pname] = ptype
+
+        self.parse_delimited("RPAREN", parse_param)
         self.eat("COLON")
-        body = []
-        if self.cur.type == "NEWLINE":
-            self.eat("NEWLINE")
-            self.eat("INDENT")
-            while self.cur.type not in ("DEDENT", "EOF"):
-                body.append(self.parse_stmt())
-            self.eat("DEDENT")
-        else:
-            body.append(self.parse_simple_stmt())
-            if self.cur.type == "NEWLINE":
-                self.eat("NEWLINE")
-        if not defaults:
-            defaults = None
-        return FuncDef(name, params, annotations, body, defaults, vararg, is_async)
+        body = self.parse_block()
+        return FuncDef(name, params, annotations, body, defaults or None, vararg, is_async)
 
-    def parse_return(self):
+    def parse_return(self) -> ReturnStmt:
         self.eat("RETURN")
         expr = self.parse_expr()
         return ReturnStmt(expr)
 
-    def parse_yield(self):
+    def parse_yield(self) -> YieldStmt:
         self.eat("YIELD")
         expr = self.parse_expr()
         return YieldStmt(expr)
 
-    def parse_expr(self):
-        return self.parse_equality()
-
-    def parse_equality(self):
-        node = self.parse_comparison()
-        while self.cur.type in ("EQEQ", "NE"):
-            op = self.cur.value
-            self.eat(self.cur.type)
-            right = self.parse_comparison()
-            node = BinOp(op, node, right)
+    def parse_expr(self) -> object:
+        memo = self.memo
+        if memo is None:
+            return self.parse_binary(1)
+        start = self.i
+        hit = memo.get(start)
+        if hit is not None:
+            node, self.i = hit
+            self.cur = self.tokens[self.i]
+            return node
+        node = self.parse_binary(1)
+        memo[start] = (node, self.i)
         return node
 
-    def parse_comparison(self):
-        node = self.parse_term()
-        while self.cur.type in ("LT", "GT", "LE", "GE"):
-            op_map = {
-                "LT": "<",
-                "GT": ">",
-                "LE": "<=",
-                "GE": ">=",
-            }
-            op = op_map[self.cur.type]
-            self.eat(self.cur.type)
-            right = self.parse_term()
-            node = BinOp(op, node, right)
-        return node
-
-    def parse_term(self):
-        node = self.parse_factor()
-        while self.cur.type in ("PLUS", "MINUS"):
-            op = "+" if self.cur.type == "PLUS" else "-"
-            self.eat(self.cur.type)
-            right = self.parse_factor()
-            node = BinOp(op, node, right)
-        return node
-
-    def parse_factor(self):
+    def parse_binary(self, min_prec: int) -> object:
+        # precedence climbing over BINARY_OPS, one loop for every level
         node = self.parse_unary()
-        while self.cur.type in ("STAR", "SLASH", "MOD"):
-            if self.cur.type == "STAR":
-                op = "*"
-            elif self.cur.type == "SLASH":
-                op = "/"
-            else:
-                op = "%"
-            self.eat(self.cur.type)
-            right = self.parse_unary()
-            node = BinOp(op, node, right)
-        return node
-
-    def parse_unary(self):
-        if self.cur.type == "PLUS":
+        ops = BINARY_OPS
+        tokens = self.tokens
+        while True:
+            entry = ops.get(self.cur.type)
+            if entry is None or entry[0] < min_prec:
+                return node
+            prec, op = entry
+            i = self.i + 1
+            self.i = i
+            self.cur = tokens[i]
+            right = self.parse_binary(prec + 1)
+            node = BinOp(op, node, right, BINOP_FUNCS[op])
+            if self.fold:
+                node = fold_binop(node)
+
+    def parse_unary(self) -> object:
+        ttype = self.cur.type
+        if ttype == "PLUS":
             self.eat("PLUS")
             return self.parse_unary()
-        if self.cur.type == "MINUS":
+        if ttype == "MINUS":
             self.eat("MINUS")
             expr = self.parse_unary()
-            return BinOp("*", IntLit(-1), expr)
-        if self.cur.type == "AWAIT":
+            if type(expr) is IntLit:
+                return IntLit(-expr.value)
+            return UnaryOp("-", expr)
+        if ttype == "AWAIT":
             self.eat("AWAIT")
             expr = self.parse_unary()
             return AwaitExpr(expr)
         return self.parse_primary()
 
-    def parse_list_lit(self):
+    def parse_list_lit(self) -> ListLit | ListComp:
         self.eat("LBRACK")
         if self.cur.type == "RBRACK":
             self.eat("RBRACK")
@@ -889,7 +863,7 @@ class Parser:
             self.eat("FOR")
             if self.cur.type != "IDENT":
                 raise SyntaxError("expected loop variable in list comprehension")
-            var = self.cur.value
+            var = cast(str, self.cur.value)
             self.eat("IDENT")
             if self.cur.type != "IN":
                 raise SyntaxError("expected 'in' in list comprehension")
@@ -901,16 +875,9 @@ class Parser:
                 cond = self.parse_expr()
             self.eat("RBRACK")
             return ListComp(first, var, iterable, cond)
-        elements = [first]
-        while self.cur.type == "COMMA":
-            self.eat("COMMA")
-            if self.cur.type == "RBRACK":
-                break
-            elements.append(self.parse_expr())
-        self.eat("RBRACK")
-        return ListLit(elements)
+        return ListLit(self.parse_delimited("RBRACK", self.parse_expr, [first]))
 
-    def parse_dict_lit(self):
+    def parse_dict_lit(self) -> DictLit | DictComp:
         self.eat("LBRACE")
         if self.cur.type == "RBRACE":
             self.eat("RBRACE")
@@ -922,7 +889,7 @@ class Parser:
             self.eat("FOR")
             if self.cur.type != "IDENT":
                 raise SyntaxError("expected loop variable in dict comprehension")
-            var = self.cur.value
+            var = cast(str, self.cur.value)
             self.eat("IDENT")
             if self.cur.type != "IN":
                 raise SyntaxError("expected 'in' in dict comprehension")
@@ -934,153 +901,122 @@ class Parser:
                 cond = self.parse_expr()
             self.eat("RBRACE")
             return DictComp(key_expr, value_expr, var, iterable, cond)
-        items = [(key_expr, value_expr)]
-        while self.cur.type == "COMMA":
-            self.eat("COMMA")
-            if self.cur.type == "RBRACE":
-                break
-            key = self.parse_expr()
-            self.eat("COLON")
-            value = self.parse_expr()
-            items.append((key, value))
-        self.eat("RBRACE")
-        return DictLit(items)
+        return DictLit(self.parse_delimited("RBRACE", self.parse_dict_item, [(key_expr, value_expr)]))
+
+    def parse_dict_item(self) -> tuple[object, object]:
+        key = self.parse_expr()
+        self.eat("COLON")
+        value = self.parse_expr()
+        return (key, value)
 
-    def parse_lambda(self):
+    def parse_lambda(self) -> LambdaExpr:
         self.eat("LAMBDA")
         params = []
         defaults = {}
 
-        if self.cur.type != "COLON":
-            while True:
-                if self.cur.type != "IDENT":
-                    raise SyntaxError("expected parameter name in lambda")
-                pname = self.cur.value
-                self.eat("IDENT")
-
-                if self.cur.type == "EQ":
-                    self.eat("EQ")
-                    defaults[pname] = self.parse_expr()
+        def parse_param() -> None:
+            if self.cur.type != "IDENT":
+                raise SyntaxError("expected parameter name in lambda")
+            pname = cast(str, self.cur.value)
+            self.eat("IDENT")
 
-                params.append(pname)
+            if self.cur.type == "EQ":
+                self.eat("EQ")
+                defaults[pname] = self.parse_expr()
 
-                if self.cur.type != "COMMA":
-                    break
-                self.eat("COMMA")
+            params.append(pname)
 
-        self.eat("COLON")
+        self.parse_delimited("COLON", parse_param)
         body = self.parse_expr()
         return LambdaExpr(params=(params, defaults), body=body)
 
-    def parse_atom(self):
-        tok = self.cur
+    def parse_call_args(self) -> tuple[list, list]:
+        self.eat("LPAREN")
+        args: list[object] = []
+        kwargs: list[tuple[str, object]] = []
+        if self.cur.type == "RPAREN":
+            self.eat("RPAREN")
+            return args, kwargs
 
-        if tok.type == "INT":
-            self.eat("INT")
-            return IntLit(tok.value)
+        def parse_arg() -> None:
+            if self.cur.type == "IDENT" and self.peek().type == "EQ":
+                key = cast(str, self.cur.value)
+                self.eat("IDENT")
+                self.eat("EQ")
+                kwargs.append((key, self.parse_expr()))
+            else:
+                args.append(self.parse_expr())
 
-        if tok.type == "STRING":
-            self.eat("STRING")
-            return StringLit(tok.value)
+        self.parse_delimited("RPAREN", parse_arg)
+        return args, kwargs
 
-        if tok.type == "LAMBDA":
-            return self.parse_lambda()
+    def parse_atom(self) -> object:
+        handler = ATOM_PARSERS.get(self.cur.type)
+        if handler is None:
+            raise SyntaxError(f"unexpected token {self.cur.type}")
+        return handler(self)
 
-        if tok.type == "IDENT":
-            name = tok.value
-            self.eat("IDENT")
+    def parse_int(self) -> IntLit:
+        value = cast(int, self.cur.value)
+        self.eat("INT")
+        return IntLit(value)
 
-            if self.cur.type == "LPAREN":
-                self.eat("LPAREN")
-                args = []
-                kwargs = []
-
-                if self.cur.type != "RPAREN":
-                    while True:
-                        if self.cur.type == "IDENT" and self.peek().type == "EQ":
-                            key = self.cur.value
-                            self.eat("IDENT")
-                            self.eat("EQ")
-                            val = self.parse_expr()
-                            kwargs.append((key, val))
-                        else:
-                            args.append(self.parse_expr())
+    def parse_string(self) -> StringLit:
+        value = cast(str, self.cur.value)
+        self.eat("STRING")
+        return StringLit(value)
 
-                        if self.cur.type != "COMMA":
-                            break
-                        self.eat("COMMA")
+    def parse_name(self) -> Call | Var:
+        name = cast(str, self.cur.value)
+        self.eat("IDENT")
 
-                self.eat("RPAREN")
-                return Call(name, args, kwargs)
+        if self.cur.type == "LPAREN":
+            args, kwargs = self.parse_call_args()
+            return Call(name, args, kwargs)
 
-            return Var(name)
+        return Var(name)
 
-        if tok.type == "LPAREN":
-            self.eat("LPAREN")
-            first = self.parse_expr()
-            if self.cur.type == "FOR":
-                self.eat("FOR")
-                if self.cur.type != "IDENT":
-                    raise SyntaxError("expected loop variable in generator expression")
-                var = self.cur.value
-                self.eat("IDENT")
-                if self.cur.type != "IN":
-                    raise SyntaxError("expected 'in' in generator expression")
-                self.eat("IN")
-                iterable = self.parse_expr()
-                cond = None
-                if self.cur.type == "IF":
-                    self.eat("IF")
-                    cond = self.parse_expr()
-                self.eat("RPAREN")
-                return GenExpr(first, var, iterable, cond)
+    def parse_paren(self) -> object:
+        self.eat("LPAREN")
+        first = self.parse_expr()
+        if self.cur.type == "FOR":
+            self.eat("FOR")
+            if self.cur.type != "IDENT":
+                raise SyntaxError("expected loop variable in generator expression")
+            var = cast(str, self.cur.value)
+            self.eat("IDENT")
+            if self.cur.type != "IN":
+                raise SyntaxError("expected 'in' in generator expression")
+            self.eat("IN")
+            iterable = self.parse_expr()
+            cond = None
+            if self.cur.type == "IF":
+                self.eat("IF")
+                cond = self.parse_expr()
             self.eat("RPAREN")
-            return first
-
-        if tok.type == "LBRACK":
-            return self.parse_list_lit()
-
-        if tok.type == "LBRACE":
-            return self.parse_dict_lit()
-
-        raise SyntaxError(f"unexpected token {tok.type}")
+            return GenExpr(first, var, iterable, cond)
+        self.eat("RPAREN")
+        return first
 
-    def parse_primary(self):
+    def parse_primary(self) -> object:
         node = self.parse_atom()
 
         while True:
-            if self.cur.type == "DOT":
+            ttype = self.cur.type
+            if ttype == "DOT":
                 self.eat("DOT")
                 if self.cur.type != "IDENT":
                     raise SyntaxError("expected name after '.'")
-                name = self.cur.value
+                name = cast(str, self.cur.value)
                 self.eat("IDENT")
 
                 if self.cur.type == "LPAREN":
-                    self.eat("LPAREN")
-                    args = []
-                    kwargs = []
-                    if self.cur.type != "RPAREN":
-                        while True:
-                            if self.cur.type == "IDENT" and self.peek().type == "EQ":
-                                key = self.cur.value
-                                self.eat("IDENT")
-                                self.eat("EQ")
-                                val = self.parse_expr()
-                                kwargs.append((key, val))
-                            else:
-                                args.append(self.parse_expr())
-
-                            if self.cur.type != "COMMA":
-                                break
-                            self.eat("COMMA")
-
-                    self.eat("RPAREN")
+                    args, kwargs = self.parse_call_args()
                     node = MethodCall(node, name, args, kwargs)
                 else:
                     node = Attr(node, name)
 
-            elif self.cur.type == "LBRACK":
+            elif ttype == "LBRACK":
                 self.eat("LBRACK")
                 if self.cur.type == "COLON":
                     start = None
@@ -1089,7 +1025,7 @@ class Parser:
 
                 if self.cur.type == "COLON":
                     self.eat("COLON")
-                    if self.cur.type in ("RBRACK", "COLON"):
+                    if self.cur.type in SLICE_STOP_END:
                         stop = None
                     else:
                         stop = self.parse_expr()
@@ -1114,226 +1050,656 @@ class Parser:
 
         return node
 
+# token type -> parser method, for the tokens that start each construct
+STMT_PARSERS = {
+    "CLASS":  Parser.parse_classdef,
+    "TRY":    Parser.parse_try,
+    "IMPORT": Parser.parse_import,
+    "WITH":   Parser.parse_with,
+    "ASYNC":  Parser.parse_async,
+    "IF":     Parser.parse_if,
+    "WHILE":  Parser.parse_while,
+    "FOR":    Parser.parse_for,
+    "DEF":    Parser.parse_funcdef,
+}
+
+SIMPLE_STMT_PARSERS = {
+    "PRINT":    Parser.parse_print,
+    "RETURN":   Parser.parse_return,
+    "YIELD":    Parser.parse_yield,
+    "BREAK":    Parser.parse_break,
+    "CONTINUE": Parser.parse_continue,
+    "NONLOCAL": Parser.parse_nonlocal,
+    "RAISE":    Parser.parse_raise,
+}
+
+ATOM_PARSERS = {
+    "INT":    Parser.parse_int,
+    "STRING": Parser.parse_string,
+    "LAMBDA": Parser.parse_lambda,
+    "IDENT":  Parser.parse_name,
+    "LPAREN": Parser.parse_paren,
+    "LBRACK": Parser.parse_list_lit,
+    "LBRACE": Parser.parse_dict_lit,
+}
+
 # =========================
-# Bytecode VM
+# Constant folding
 # =========================
 
-@dataclass
-class Instruction:
-    op: str
-    arg: object = None
-
-def compile_program_to_bytecode(prog):
-    instrs = []
-    for stmt in prog.stmts:
-        instrs.append(Instruction("EXEC_STMT", stmt))
-    instrs.append(Instruction("HALT", None))
-    return instrs
+# folded results bigger than these stay as runtime work
+FOLD_MAX_STR = 4096
+FOLD_MAX_INT_BITS = 4096
+FOLDABLE_LITERALS = frozenset({IntLit, StringLit})
+
+def _fold_len(value):
+    # upper bound on len(str(value)) without building it
+    if type(value) is str:
+        return len(value)
+    return value.bit_length() // 3 + 2
+
+def fold_too_big(op, left, right):
+    # estimated from the operands, so nothing large is ever allocated
+    if op == "*":
+        if type(left) is str:
+            return type(right) is int and len(left) * right > FOLD_MAX_STR
+        # int * str is a runtime error, left for the evaluator to report
+        return type(right) is int and left.bit_length() + right.bit_length() > FOLD_MAX_INT_BITS
+    if op == "+" and (type(left) is str or type(right) is str):
+        return _fold_len(left) + _fold_len(right) > FOLD_MAX_STR
+    return False
 
-def run_bytecode(instrs, env):
-    global CURRENT_OUT
-    out = []
-    prev_out = CURRENT_OUT
-    CURRENT_OUT = out
-    ip = 0
-    while ip < len(instrs):
-        ins = instrs[ip]
-        if ins.op == "EXEC_STMT":
-            eval_stmt(ins.arg, env, out)
-            ip += 1
-        elif ins.op == "HALT":
-            break
-        else:
-            raise RuntimeError(f"unknown opcode {ins.op}")
-    CURRENT_OUT = prev_out
-    return "".join(out)
+def fold_binop(node):
+    left, right = node.left, node.right
+    if type(left) not in FOLDABLE_LITERALS or type(right) not in FOLDABLE_LITERALS:
+        return node
+    if fold_too_big(node.op, left.value, right.value):
+        return node
+    try:
+        val = node.fn(left.value, right.value)
+    except Exception:
+        # leave it to raise at runtime, if that code ever runs
+        return node
+    if type(val) is int and val.bit_length() <= FOLD_MAX_INT_BITS:
+        return IntLit(val)
+    if type(val) is str and len(val) <= FOLD_MAX_STR:
+        return StringLit(val)
+    return node
 
 # =========================
 # Interpreter
 # =========================
 
-class ReturnException(Exception):
-    def __init__(self, value):
-        self.value = value
-
-class BreakException(Exception):
-    pass
-
-class ContinueException(Exception):
-    pass
+# a compiled statement returns None to fall through to the next one, or a
+# signal: RETURN after a `return` ran, with the value left in
+# env.return_value, or BREAK/CONTINUE for the innermost enclosing loop
+RETURN = object()
+BREAK = object()
+CONTINUE = object()
+
+# raised when a signal reaches the top of a module, class or function body
+SIGNAL_ERRORS = {
+    RETURN:   "'return' outside function",
+    BREAK:    "'break' outside loop",
+    CONTINUE: "'continue' not properly in loop",
+}
 
 class LangException(Exception):
     def __init__(self, value):
         self.value = value
 
 class Env:
-    def __init__(self, parent=None):
+    __slots__ = ("vars", "funcs", "classes", "parent", "nonlocal_vars", "yield_values", "return_value")
+
+    vars: dict[str, object]
+    funcs: dict[str, "FunctionObject"]
+    classes: dict[str, "ClassObject"]
+    parent: "Env | None"
+    nonlocal_vars: set[str]
+    yield_values: list | None
+    return_value: object
+
+    def __init__(self, parent: "Env | None" = None) -> None:
         self.vars = {}
         self.funcs = {}
         self.classes = {}
         self.parent = parent
         self.nonlocal_vars = set()
         self.yield_values = None
+        self.return_value = None
 
-    def get_var(self, name):
+    def get_var(self, name: str) -> object:
         if name in self.vars:
             return self.vars[name]
         if self.parent:
             return self.parent.get_var(name)
         raise NameError(f"undefined variable {name}")
 
-    def _set_nonlocal(self, name, value):
+    def _set_nonlocal(self, name: str, value: object) -> None:
         if self.parent is None:
             raise NameError(f"no binding for nonlocal {name}")
-        if name in self.parent.vars:
-            self.parent.vars[name] = value
-        else:
+        if not self.parent._rebind(name, value):
             self.parent._set_nonlocal(name, value)
 
-    def set_var(self, name, value):
+    def _rebind(self, name: str, value: object) -> bool:
+        if name in self.vars:
+            self.vars[name] = value
+            return True
+        return False
+
+    def set_var(self, name: str, value: object) -> None:
         if name in self.nonlocal_vars:
             self._set_nonlocal(name, value)
             return
-        from_types = globals().get("FunctionObject", None)
-        if from_types is not None and isinstance(value, FunctionObject):
+        if isinstance(value, FunctionObject):
             self.funcs[name] = value
         self.vars[name] = value
 
-    def declare_nonlocal(self, name):
+    def declare_nonlocal(self, name: str) -> None:
         self.nonlocal_vars.add(name)
 
-    def get_func(self, name):
-        if name in self.funcs:
-            return self.funcs[name]
-        if self.parent:
-            return self.parent.get_func(name)
+    def get_func(self, name: str) -> "FunctionObject":
+        env: Env | None = self
+        while env is not None:
+            if name in env.funcs:
+                return env.funcs[name]
+            env = env.parent
         raise NameError(f"undefined function {name}")
 
-    def set_func(self, name, fn):
+    def set_func(self, name: str, fn: "FunctionObject") -> None:
         self.funcs[name] = fn
 
-    def get_class(self, name):
-        if name in self.classes:
-            return self.classes[name]
-        if self.parent:
-            return self.parent.get_class(name)
+    def get_class(self, name: str) -> "ClassObject":
+        env: Env | None = self
+        while env is not None:
+            if name in env.classes:
+                return env.classes[name]
+            env = env.parent
         raise NameError(f"undefined class {name}")
 
-    def set_class(self, name, cls):
+    def set_class(self, name: str, cls: "ClassObject") -> None:
         self.classes[name] = cls
 
-@dataclass
+# marks a local slot that has not been assigned yet in this call
+UNBOUND = object()
+
+class Frame(Env):
+    # scope of one function call: every name the body assigns has a fixed
+    # index (see local_slots) into a flat list, compiled Var/Assign nodes
+    # index it directly. Other names still go through the Env dicts.
+    __slots__ = ("names", "slots")
+    names: dict[str, int]
+    slots: list[object]
+
+    def __init__(self, names: dict[str, int], parent: Env | None = None) -> None:
+        super().__init__(parent)
+        self.names = names
+        self.slots = [UNBOUND] * len(names)
+
+    def get_var(self, name: str) -> object:
+        i = self.names.get(name)
+        if i is not None:
+            val = self.slots[i]
+            if val is not UNBOUND:
+                return val
+        elif name in self.vars:
+            return self.vars[name]
+        if self.parent:
+            return self.parent.get_var(name)
+        raise NameError(f"undefined variable {name}")
+
+    def reset(self) -> None:
+        # make a finished call's frame ready for the next call of the function
+        self.slots = [UNBOUND] * len(self.names)
+        self.vars.clear()
+        self.funcs.clear()
+        self.classes.clear()
+        self.nonlocal_vars.clear()
+        self.return_value = None
+
+    def set_var(self, name: str, value: object) -> None:
+        i = self.names.get(name)
+        if i is None:
+            Env.set_var(self, name, value)
+            return
+        if isinstance(value, FunctionObject):
+            self.funcs[name] = value
+        self.slots[i] = value
+
+    def _rebind(self, name: str, value: object) -> bool:
+        i = self.names.get(name)
+        if i is None:
+            return Env._rebind(self, name, value)
+        if self.slots[i] is UNBOUND:
+            return False
+        self.slots[i] = value
+        return True
+
+@dataclass(slots=True)
 class FunctionObject:
     name: str
     params: list
-    body: list
+    body: tuple
     env: Env
+    code: "StmtCode"                # compile_block(body)
     is_method: bool = False
     annotations: dict | None = None
     defaults: dict | None = None    # param name -> value
     vararg: str | None = None
     call_count: int = 0
-    jit_impl: object | None = None
+    jit_impl: Callable[..., object] | None = None
     is_async: bool = False
+    has_yield: bool = False
+    local_names: dict = field(default_factory=dict)   # name -> Frame slot
+    param_checks: tuple = ()        # (param, type, type name) per annotated param
+    frame_pool: list | None = None  # spare Frames, None if calls can't share them
 
-@dataclass
+@dataclass(slots=True)
 class ClassObject:
     name: str
     methods: dict
     attributes: dict
     base: "ClassObject | None" = None
+    # methods/attributes merged down the base chain, so a lookup is one dict
+    # hit; classes are immutable once defined so this never goes stale
+    resolved_methods: dict = field(init=False, repr=False)
+    resolved_attrs: dict = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        base = self.base
+        if base is None:
+            self.resolved_methods = dict(self.methods)
+            self.resolved_attrs = dict(self.attributes)
+        else:
+            self.resolved_methods = {**base.resolved_methods, **self.methods}
+            self.resolved_attrs = {**base.resolved_attrs, **self.attributes}
 
-@dataclass
+@dataclass(slots=True)
 class InstanceObject:
     cls: ClassObject
     fields: dict
 
-@dataclass
+@dataclass(slots=True)
 class ModuleObject:
     name: str
     env: Env
 
-def class_lookup_attr(cls, name):
-    c = cls
-    while c is not None:
-        if name in c.attributes:
-            return c.attributes[name]
-        c = c.base
-    return None
-
-def class_lookup_method(cls, name):
-    c = cls
-    while c is not None:
-        if name in c.methods:
-            return c.methods[name]
-        c = c.base
-    return None
-
-def eval_block(stmts, env, out):
-    for s in stmts:
-        eval_stmt(s, env, out)
-
-def eval_program(prog):
-    env = Env()
-    bytecode = compile_program_to_bytecode(prog)
-    return run_bytecode(bytecode, env)
-
-def eval_stmt(stmt, env, out):
-    if isinstance(stmt, Assign):
-        val = eval_expr(stmt.expr, env)
-        env.set_var(stmt.name, val)
-    elif isinstance(stmt, AttrAssign):
-        obj = eval_expr(stmt.obj, env)
-        val = eval_expr(stmt.expr, env)
+def class_lookup_attr(cls: ClassObject, name: str) -> object:
+    return cls.resolved_attrs.get(name)
+
+def class_lookup_method(cls: ClassObject, name: str) -> FunctionObject | None:
+    return cls.resolved_methods.get(name)
+
+def run_program(prog: Program, env: Env) -> bytes:
+    global CURRENT_OUT
+    code = compile_module(prog.stmts)
+    out = bytearray()
+    prev_out = CURRENT_OUT
+    CURRENT_OUT = out
+    signal = code(env, out)
+    if signal is not None:
+        raise RuntimeError(SIGNAL_ERRORS[signal])
+    CURRENT_OUT = prev_out
+    return bytes(out)
+
+def eval_program(prog: Program) -> bytes:
+    return run_program(prog, Env())
+
+def literal_output(prog: Program) -> bytes | None:
+    # programs that only print literals (after folding) need no interpreter
+    for stmt in prog.stmts:
+        if type(stmt) is not PrintStmt or type(stmt.expr) not in (IntLit, StringLit):
+            return None
+    return b"".join(str(stmt.expr.value).encode() + b"\n" for stmt in prog.stmts)
+
+# --------------------
+# binary operators
+# --------------------
+
+def _op_add(left, right):
+    if type(left) is int and type(right) is int:
+        return left + right
+    if isinstance(left, str) or isinstance(right, str):
+        return str(left) + str(right)
+    if isinstance(left, list) and isinstance(right, list):
+        return left + right
+    if isinstance(left, int) and isinstance(right, int):
+        return left + right
+    raise RuntimeError(f"unsupported + between {type(left).__name__} and {type(right).__name__}")
+
+def _op_sub(left, right):
+    if type(left) is int and type(right) is int:
+        return left - right
+    if isinstance(left, int) and isinstance(right, int):
+        return left - right
+    raise RuntimeError(f"unsupported - between {type(left).__name__} and {type(right).__name__}")
+
+def _op_mul(left, right):
+    if type(left) is int and type(right) is int:
+        return left * right
+    if isinstance(left, int) and isinstance(right, int):
+        return left * right
+    if isinstance(left, str) and isinstance(right, int):
+        return left * right
+    if isinstance(left, list) and isinstance(right, int):
+        return left * right
+    raise RuntimeError(f"unsupported * between {type(left).__name__} and {type(right).__name__}")
+
+def _op_div(left, right):
+    if type(left) is int and type(right) is int:
+        return left // right
+    if isinstance(left, int) and isinstance(right, int):
+        return left // right
+    raise RuntimeError(f"unsupported / between {type(left).__name__} and {type(right).__name__}")
+
+def _op_mod(left, right):
+    if type(left) is int and type(right) is int:
+        return left % right
+    if isinstance(left, int) and isinstance(right, int):
+        return left % right
+    raise RuntimeError(f"unsupported % between {type(left).__name__} and {type(right).__name__}")
+
+BINOP_FUNCS = {
+    "+":  _op_add,
+    "-":  _op_sub,
+    "*":  _op_mul,
+    "/":  _op_div,
+    "%":  _op_mod,
+    "<":  operator.lt,
+    ">":  operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# =========================
+# Closure compiler
+# =========================
+#
+# Every AST node is compiled once into a Python closure: statements become
+# run(env, out) and expressions ev(env). Children are compiled up front and
+# captured by the parent closure, so executing a node is a direct call with
+# no per-node type dispatch.
+
+StmtCode = Callable[[Env, bytearray], object]   # returns None or a signal
+ExprCode = Callable[[Env], object]
+
+@dataclass(slots=True)
+class CompileCtx:
+    # per-module state, passed down next to scope through every compiler
+    stable_funcs: frozenset     # names _compile_call may link (see stable_function_names)
+
+def compile_block(stmts: tuple, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    compiled = tuple(compile_stmt(s, scope, ctx) for s in stmts)
+    if len(compiled) == 1:
+        return compiled[0]
+
+    def run(env, out):
+        for s in compiled:
+            signal = s(env, out)
+            if signal is not None:
+                return signal
+    return run
+
+def compile_stmt(stmt: object, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    compiler = STMT_COMPILERS.get(type(stmt))
+    if compiler is None:
+        raise RuntimeError("unknown statement")
+    return compiler(stmt, scope, ctx)
+
+def compile_expr(expr: object, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    compiler = EXPR_COMPILERS.get(type(expr))
+    if compiler is None:
+        raise RuntimeError("unknown expression")
+    return compiler(expr, scope, ctx)
+
+def compile_args(args_exprs: list, kwargs_exprs: list, scope: dict[str, int] | None, ctx: CompileCtx) -> tuple[tuple, tuple]:
+    args = tuple(compile_expr(a, scope, ctx) for a in args_exprs)
+    kwargs = tuple((key, compile_expr(a, scope, ctx)) for key, a in kwargs_exprs)
+    return args, kwargs
+
+# --------------------
+# local slots
+# --------------------
+#
+# A function body is compiled against a scope: a dict mapping each name the
+# body itself binds to an index into its Frame's slot list. Module and class
+# bodies compile with scope None and keep using the Env dicts.
+
+def local_slots(params: list, vararg: str | None, body: tuple) -> dict[str, int]:
+    bound = list(params)
+    if vararg is not None:
+        bound.append(vararg)
+    declared_nonlocal: set[str] = set()
+    _collect_bound_names(body, bound, declared_nonlocal)
+    names: dict[str, int] = {}
+    for name in bound:
+        # nonlocal names are rebound in an outer scope at runtime
+        if name not in declared_nonlocal and name not in names:
+            names[name] = len(names)
+    return names
+
+def _collect_bound_names(node, bound, declared_nonlocal):
+    if isinstance(node, (list, tuple)):
+        for item in node:
+            _collect_bound_names(item, bound, declared_nonlocal)
+        return
+    if isinstance(node, dict):
+        for item in node.values():
+            _collect_bound_names(item, bound, declared_nonlocal)
+        return
+    if not hasattr(node, "__dataclass_fields__"):
+        return
+    t = type(node)
+    if t is Assign:
+        bound.append(node.name)
+    elif t in (ForStmt, ListComp, DictComp, GenExpr):
+        bound.append(node.var)
+    elif t is WithStmt and node.var is not None:
+        bound.append(node.var)
+    elif t is NonlocalStmt:
+        declared_nonlocal.update(node.names)
+        return
+    elif t is FuncDef:
+        # the body is its own scope, the defaults run in this one
+        bound.append(node.name)
+        _collect_bound_names(node.defaults or {}, bound, declared_nonlocal)
+        return
+    elif t is ClassDef:
+        bound.append(node.name)
+        return
+    elif t is LambdaExpr:
+        _collect_bound_names(node.params[1], bound, declared_nonlocal)
+        return
+    for f in fields(node):
+        _collect_bound_names(getattr(node, f.name), bound, declared_nonlocal)
+
+def _captures_frame(node):
+    # a def, lambda or class body keeps the env it runs in as its parent and
+    # a generator expression evaluates lazily in it, so the frame of a call
+    # that ran one may still be in use after the call returns
+    if isinstance(node, (list, tuple)):
+        return any(_captures_frame(item) for item in node)
+    if isinstance(node, dict):
+        return any(_captures_frame(item) for item in node.values())
+    if not hasattr(node, "__dataclass_fields__"):
+        return False
+    if type(node) in (FuncDef, ClassDef, LambdaExpr, GenExpr):
+        return True
+    return any(_captures_frame(getattr(node, f.name)) for f in fields(node))
+
+def _compile_store(name: str, scope: dict[str, int] | None) -> Callable[[Env, object], None]:
+    if scope is not None and name in scope:
+        i = scope[name]
+
+        def store_slot(env, value):
+            if isinstance(value, FunctionObject):
+                env.funcs[name] = value
+            env.slots[i] = value
+        return store_slot
+
+    def store(env, value):
+        env.set_var(name, value)
+    return store
+
+def _raise_at_runtime(msg: str) -> ExprCode:
+    # argument errors in builtin calls must only fire if the call runs
+    def ev(env):
+        raise RuntimeError(msg)
+    return ev
+
+# --------------------
+# statements
+# --------------------
+
+def _compile_assign(stmt: Assign, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    name = stmt.name
+    value = compile_expr(stmt.expr, scope, ctx)
+    if scope is not None and name in scope:
+        i = scope[name]
+
+        def run_slot(env, out):
+            val = value(env)
+            if isinstance(val, FunctionObject):
+                env.funcs[name] = val
+            env.slots[i] = val
+        return run_slot
+
+    def run(env, out):
+        env.set_var(name, value(env))
+    return run
+
+def _compile_attr_assign(stmt: AttrAssign, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    name = stmt.name
+    obj_ev = compile_expr(stmt.obj, scope, ctx)
+    value = compile_expr(stmt.expr, scope, ctx)
+
+    def run(env, out):
+        obj = obj_ev(env)
+        val = value(env)
         if isinstance(obj, InstanceObject):
-            obj.fields[stmt.name] = val
+            obj.fields[name] = val
         else:
             raise RuntimeError("attribute assignment only supported on objects")
-    elif isinstance(stmt, IndexAssign):
-        seq = eval_expr(stmt.seq, env)
-        idx = eval_expr(stmt.index, env)
-        val = eval_expr(stmt.expr, env)
+    return run
+
+def _compile_index_assign(stmt: IndexAssign, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    seq_ev = compile_expr(stmt.seq, scope, ctx)
+    idx_ev = compile_expr(stmt.index, scope, ctx)
+    value = compile_expr(stmt.expr, scope, ctx)
+
+    def run(env, out):
+        seq = seq_ev(env)
+        idx = idx_ev(env)
+        val = value(env)
         try:
             seq[idx] = val
         except Exception as e:
             raise RuntimeError(f"index assignment error: {e}")
-    elif isinstance(stmt, PrintStmt):
-        val = eval_expr(stmt.expr, env)
-        out.append(str(val) + "\n")
-    elif isinstance(stmt, IfStmt):
-        cond = eval_expr(stmt.cond, env)
-        if bool(cond):
-            eval_block(stmt.body, env, out)
-    elif isinstance(stmt, WhileStmt):
-        while bool(eval_expr(stmt.cond, env)):
-            try:
-                eval_block(stmt.body, env, out)
-            except BreakException:
-                break
-            except ContinueException:
-                continue
-    elif isinstance(stmt, ForStmt):
-        iterable_val = eval_expr(stmt.iterable, env)
+    return run
+
+def _compile_print(stmt: PrintStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    value = compile_expr(stmt.expr, scope, ctx)
+
+    def run(env, out):
+        val = value(env)
+        if type(val) is int:
+            out += b"%d\n" % val
+            return
+        out += (val if type(val) is str else str(val)).encode()
+        out += b"\n"
+    return run
+
+def _compile_if(stmt: IfStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    cond = compile_expr(stmt.cond, scope, ctx)
+    body = compile_block(stmt.body, scope, ctx)
+
+    def run(env, out):
+        if cond(env):
+            return body(env, out)
+    return run
+
+def _compile_while(stmt: WhileStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    cond = compile_expr(stmt.cond, scope, ctx)
+    body = compile_block(stmt.body, scope, ctx)
+
+    def run(env, out):
+        # locals, not closure cells, inside the loop
+        test = cond
+        block = body
+        while test(env):
+            signal = block(env, out)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                if signal is not CONTINUE:
+                    return signal
+    return run
+
+def _compile_for(stmt: ForStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    it = stmt.iterable
+    if (scope is not None and stmt.var in scope and type(it) is Call and it.name == "range"
+            and len(it.args) == 1 and not it.kwargs):
+        return _compile_for_range(stmt, scope, ctx)
+    store = _compile_store(stmt.var, scope)
+    iterable = compile_expr(stmt.iterable, scope, ctx)
+    body = compile_block(stmt.body, scope, ctx)
+
+    def run(env, out):
+        iterable_val = iterable(env)
         try:
             iterator = iter(iterable_val)
         except TypeError:
             raise RuntimeError("object not iterable in for loop")
+        put = store
+        block = body
         for value in iterator:
-            env.set_var(stmt.var, value)
-            try:
-                eval_block(stmt.body, env, out)
-            except BreakException:
-                break
-            except ContinueException:
-                continue
-    elif isinstance(stmt, ClassDef):
+            put(env, value)
+            signal = block(env, out)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                if signal is not CONTINUE:
+                    return signal
+    return run
+
+def _compile_for_range(stmt: ForStmt, scope: dict[str, int], ctx: CompileCtx) -> StmtCode:
+    # `for <local> in range(n)`: a counted loop storing straight into the
+    # slot, no iter() check and no FunctionObject check (items are ints)
+    i = scope[stmt.var]
+    rng = compile_expr(stmt.iterable, scope, ctx)
+    body = compile_block(stmt.body, scope, ctx)
+
+    def run(env, out):
+        slots = env.slots
+        k = i
+        block = body
+        for value in rng(env):
+            slots[k] = value
+            signal = block(env, out)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                if signal is not CONTINUE:
+                    return signal
+    return run
+
+def _compile_classdef(stmt: ClassDef, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    name = stmt.name
+    base_name = stmt.base_name
+    body = compile_block(stmt.body, None, ctx)
+
+    def run(env, out):
         class_env = Env(parent=env)
-        tmp_out = []
-        eval_block(stmt.body, class_env, tmp_out)
+        tmp_out = bytearray()
+        signal = body(class_env, tmp_out)
+        if signal is not None:
+            raise RuntimeError(SIGNAL_ERRORS[signal])
         methods = {}
-        for name, fn in class_env.funcs.items():
+        for fname, fn in class_env.funcs.items():
             fn.is_method = True
-            methods[name] = fn
+            methods[fname] = fn
 
         attrs = {}
         for k, v in class_env.vars.items():
@@ -1344,18 +1710,34 @@ def eval_stmt(stmt, env, out):
                 attrs[k] = v
 
         base_cls = None
-        if stmt.base_name is not None:
-            base_cls = env.get_class(stmt.base_name)
-        cls_obj = ClassObject(stmt.name, methods, attrs, base_cls)
-        env.set_class(stmt.name, cls_obj)
-        env.set_var(stmt.name, cls_obj)
-    elif isinstance(stmt, FuncDef):
+        if base_name is not None:
+            base_cls = env.get_class(base_name)
+        cls_obj = ClassObject(name, methods, attrs, base_cls)
+        env.set_class(name, cls_obj)
+        env.set_var(name, cls_obj)
+    return run
+
+def _compile_funcdef(stmt: FuncDef, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    name = stmt.name
+    local_names = local_slots(stmt.params, stmt.vararg, stmt.body)
+    code = compile_block(stmt.body, local_names, ctx)
+    defaults = tuple((pname, compile_expr(dexpr, scope, ctx)) for pname, dexpr in (stmt.defaults or {}).items())
+    has_yield = any(isinstance(s, YieldStmt) for s in stmt.body)
+    # frames of calls that can't be referenced after returning are recycled
+    pooled = not _captures_frame(stmt.body)
+    annotations = stmt.annotations or {}
+    param_checks = tuple(
+        (pname, TYPE_MAP[annotations[pname]], annotations[pname])
+        for pname in stmt.params
+        if annotations.get(pname) in TYPE_MAP
+    )
+
+    def run(env, out):
         defaults_values = {}
-        if stmt.defaults:
-            for pname, dexpr in stmt.defaults.items():
-                defaults_values[pname] = eval_expr(dexpr, env)
+        for pname, dflt in defaults:
+            defaults_values[pname] = dflt(env)
         fn = FunctionObject(
-            stmt.name,
+            name,
             stmt.params,
             stmt.body,
             env,
@@ -1364,24 +1746,56 @@ def eval_stmt(stmt, env, out):
             defaults=defaults_values if defaults_values else None,
             vararg=stmt.vararg,
             is_async=stmt.is_async,
+            code=code,
+            has_yield=has_yield,
+            local_names=local_names,
+            param_checks=param_checks,
+            frame_pool=[] if pooled else None,
         )
-        env.set_var(stmt.name, fn)
-        env.set_func(stmt.name, fn)
-    elif isinstance(stmt, TryStmt):
+        env.set_var(name, fn)
+        env.set_func(name, fn)
+    return run
+
+def _compile_try(stmt: TryStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    body = compile_block(stmt.body, scope, ctx)
+    handler = compile_block(stmt.handler, scope, ctx)
+
+    def run(env, out):
         try:
-            eval_block(stmt.body, env, out)
+            return body(env, out)
         except LangException:
-            eval_block(stmt.handler, env, out)
-    elif isinstance(stmt, RaiseStmt):
-        val = eval_expr(stmt.expr, env)
-        raise LangException(val)
-    elif isinstance(stmt, NonlocalStmt):
-        for name in stmt.names:
+            return handler(env, out)
+    return run
+
+def _compile_raise(stmt: RaiseStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    value = compile_expr(stmt.expr, scope, ctx)
+
+    def run(env, out):
+        raise LangException(value(env))
+    return run
+
+def _compile_nonlocal(stmt: NonlocalStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    names = tuple(stmt.names)
+
+    def run(env, out):
+        for name in names:
             env.declare_nonlocal(name)
-    elif isinstance(stmt, ImportStmt):
-        import_module(stmt.module, env)
-    elif isinstance(stmt, WithStmt):
-        cm_val = eval_expr(stmt.expr, env)
+    return run
+
+def _compile_import(stmt: ImportStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    module = stmt.module
+
+    def run(env, out):
+        import_module(module, env)
+    return run
+
+def _compile_with(stmt: WithStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    cm_ev = compile_expr(stmt.expr, scope, ctx)
+    store = _compile_store(stmt.var, scope) if stmt.var is not None else None
+    body = compile_block(stmt.body, scope, ctx)
+
+    def run(env, out):
+        cm_val = cm_ev(env)
         bound_val = cm_val
         exit_fn = None
         if isinstance(cm_val, InstanceObject):
@@ -1389,76 +1803,153 @@ def eval_stmt(stmt, env, out):
             exit_fn = class_lookup_method(cm_val.cls, "__exit__")
             if enter_fn is not None:
                 bound_val = _invoke_function(enter_fn, [cm_val], {})
-        if stmt.var is not None:
-            env.set_var(stmt.var, bound_val)
+        if store is not None:
+            store(env, bound_val)
         try:
-            eval_block(stmt.body, env, out)
+            return body(env, out)
         finally:
             if isinstance(cm_val, InstanceObject) and exit_fn is not None:
                 _invoke_function(exit_fn, [cm_val, None, None, None], {})
-    elif isinstance(stmt, ReturnStmt):
-        val = eval_expr(stmt.expr, env)
-        raise ReturnException(val)
-    elif isinstance(stmt, YieldStmt):
-        val = eval_expr(stmt.expr, env)
+    return run
+
+def _compile_return(stmt: ReturnStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    value = compile_expr(stmt.expr, scope, ctx)
+
+    def run(env, out):
+        env.return_value = value(env)
+        return RETURN
+    return run
+
+def _compile_yield(stmt: YieldStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    value = compile_expr(stmt.expr, scope, ctx)
+
+    def run(env, out):
+        val = value(env)
         if env.yield_values is None:
             env.yield_values = []
         env.yield_values.append(val)
-    elif isinstance(stmt, BreakStmt):
-        raise BreakException()
-    elif isinstance(stmt, ContinueStmt):
-        raise ContinueException()
-    elif isinstance(stmt, ExprStmt):
-        eval_expr(stmt.expr, env)
-    else:
-        raise RuntimeError("unknown statement")
+    return run
+
+def _compile_break(stmt: BreakStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    def run(env, out):
+        return BREAK
+    return run
+
+def _compile_continue(stmt: ContinueStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    def run(env, out):
+        return CONTINUE
+    return run
+
+def _compile_expr_stmt(stmt: ExprStmt, scope: dict[str, int] | None, ctx: CompileCtx) -> StmtCode:
+    value = compile_expr(stmt.expr, scope, ctx)
+
+    def run(env, out):
+        value(env)
+    return run
+
+STMT_COMPILERS: dict[type, Callable[..., StmtCode]] = {
+    Assign:       _compile_assign,
+    AttrAssign:   _compile_attr_assign,
+    IndexAssign:  _compile_index_assign,
+    PrintStmt:    _compile_print,
+    IfStmt:       _compile_if,
+    WhileStmt:    _compile_while,
+    ForStmt:      _compile_for,
+    ClassDef:     _compile_classdef,
+    FuncDef:      _compile_funcdef,
+    TryStmt:      _compile_try,
+    RaiseStmt:    _compile_raise,
+    NonlocalStmt: _compile_nonlocal,
+    ImportStmt:   _compile_import,
+    WithStmt:     _compile_with,
+    ReturnStmt:   _compile_return,
+    YieldStmt:    _compile_yield,
+    BreakStmt:    _compile_break,
+    ContinueStmt: _compile_continue,
+    ExprStmt:     _compile_expr_stmt,
+}
 
-def eval_expr(expr, env):
-    if isinstance(expr, IntLit):
-        return expr.value
-    if isinstance(expr, StringLit):
-        return expr.value
-    if isinstance(expr, ListLit):
-        return [eval_expr(e, env) for e in expr.elements]
-    if isinstance(expr, ListComp):
-        iterable_val = eval_expr(expr.iterable, env)
+# --------------------
+# expressions
+# --------------------
+
+def _compile_literal(expr: IntLit | StringLit, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    value = expr.value
+
+    def ev(env):
+        return value
+    return ev
+
+def _compile_list_lit(expr: ListLit, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    elements = tuple(compile_expr(e, scope, ctx) for e in expr.elements)
+
+    def ev(env):
+        return [e(env) for e in elements]
+    return ev
+
+def _compile_list_comp(expr: ListComp, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    store = _compile_store(expr.var, scope)
+    iterable = compile_expr(expr.iterable, scope, ctx)
+    cond = compile_expr(expr.cond, scope, ctx) if expr.cond is not None else None
+    elem = compile_expr(expr.expr, scope, ctx)
+
+    def ev(env):
+        iterable_val = iterable(env)
         try:
             iterator = iter(iterable_val)
         except TypeError:
             raise RuntimeError("object not iterable in list comprehension")
         result = []
         for value in iterator:
-            env.set_var(expr.var, value)
-            if expr.cond is not None:
-                if not bool(eval_expr(expr.cond, env)):
-                    continue
-            result.append(eval_expr(expr.expr, env))
+            store(env, value)
+            if cond is not None and not cond(env):
+                continue
+            result.append(elem(env))
         return result
-    if isinstance(expr, DictLit):
+    return ev
+
+def _compile_dict_lit(expr: DictLit, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    items = tuple((compile_expr(k, scope, ctx), compile_expr(v, scope, ctx)) for k, v in expr.items)
+
+    def ev(env):
         d = {}
-        for k_expr, v_expr in expr.items:
-            k = eval_expr(k_expr, env)
-            v = eval_expr(v_expr, env)
-            d[k] = v
+        for k_ev, v_ev in items:
+            k = k_ev(env)
+            d[k] = v_ev(env)
         return d
-    if isinstance(expr, DictComp):
+    return ev
+
+def _compile_dict_comp(expr: DictComp, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    store = _compile_store(expr.var, scope)
+    iterable = compile_expr(expr.iterable, scope, ctx)
+    cond = compile_expr(expr.cond, scope, ctx) if expr.cond is not None else None
+    key_ev = compile_expr(expr.key_expr, scope, ctx)
+    value_ev = compile_expr(expr.value_expr, scope, ctx)
+
+    def ev(env):
         d = {}
-        iterable_val = eval_expr(expr.iterable, env)
+        iterable_val = iterable(env)
         try:
             iterator = iter(iterable_val)
         except TypeError:
             raise RuntimeError("object not iterable in dict comprehension")
         for value in iterator:
-            env.set_var(expr.var, value)
-            if expr.cond is not None:
-                if not bool(eval_expr(expr.cond, env)):
-                    continue
-            k = eval_expr(expr.key_expr, env)
-            v = eval_expr(expr.value_expr, env)
-            d[k] = v
+            store(env, value)
+            if cond is not None and not cond(env):
+                continue
+            k = key_ev(env)
+            d[k] = value_ev(env)
         return d
-    if isinstance(expr, GenExpr):
-        iterable_val = eval_expr(expr.iterable, env)
+    return ev
+
+def _compile_gen_expr(expr: GenExpr, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    store = _compile_store(expr.var, scope)
+    iterable = compile_expr(expr.iterable, scope, ctx)
+    cond = compile_expr(expr.cond, scope, ctx) if expr.cond is not None else None
+    elem = compile_expr(expr.expr, scope, ctx)
+
+    def ev(env):
+        iterable_val = iterable(env)
         try:
             iterator = iter(iterable_val)
         except TypeError:
@@ -1466,54 +1957,96 @@ def eval_expr(expr, env):
 
         def generator():
             for value in iterator:
-                env.set_var(expr.var, value)
-                if expr.cond is not None and not bool(eval_expr(expr.cond, env)):
+                store(env, value)
+                if cond is not None and not cond(env):
                     continue
-                yield eval_expr(expr.expr, env)
+                yield elem(env)
 
         return generator()
-    if isinstance(expr, LambdaExpr):
-        body_stmt = ReturnStmt(expr.body)
-        params, defaults_ast = expr.params
-        defaults = {}
-        for k, v in defaults_ast.items():
-            defaults[k] = eval_expr(v, env)
+    return ev
 
-        fn = FunctionObject(
+def _compile_lambda(expr: LambdaExpr, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    params, defaults_ast = expr.params
+    body = (ReturnStmt(expr.body),)
+    local_names = local_slots(params, None, body)
+    code = compile_block(body, local_names, ctx)
+    defaults = tuple((k, compile_expr(v, scope, ctx)) for k, v in defaults_ast.items())
+
+    def ev(env):
+        defaults_values = {}
+        for k, dflt in defaults:
+            defaults_values[k] = dflt(env)
+        return FunctionObject(
             "<lambda>",
             params,
-            [body_stmt],
+            body,
             env,
             is_method=False,
             annotations=None,
-            defaults=defaults if defaults else None,
-            vararg=None
+            defaults=defaults_values if defaults_values else None,
+            vararg=None,
+            code=code,
+            local_names=local_names,
         )
-        return fn
-    if isinstance(expr, AwaitExpr):
-        # async is just syntax here, no real async
-        return eval_expr(expr.expr, env)
-    if isinstance(expr, Var):
-        return env.get_var(expr.name)
-    if isinstance(expr, Index):
-        seq_val = eval_expr(expr.seq, env)
-        idx_val = eval_expr(expr.index, env)
+    return ev
+
+def _compile_await(expr: AwaitExpr, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    # async is just syntax here, no real async
+    return compile_expr(expr.expr, scope, ctx)
+
+def _compile_var(expr: Var, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    name = expr.name
+    if scope is not None and name in scope:
+        i = scope[name]
+
+        def ev_slot(env):
+            val = env.slots[i]
+            if val is UNBOUND:
+                # not assigned yet in this call, look further out
+                return env.parent.get_var(name)
+            return val
+        return ev_slot
+
+    def ev(env):
+        return env.get_var(name)
+    return ev
+
+def _compile_index(expr: Index, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    seq_ev = compile_expr(expr.seq, scope, ctx)
+    idx_ev = compile_expr(expr.index, scope, ctx)
+
+    def ev(env):
+        seq_val = seq_ev(env)
+        idx_val = idx_ev(env)
         try:
             return seq_val[idx_val]
         except Exception as e:
             raise RuntimeError(f"index error: {e}")
-    if isinstance(expr, SliceIndex):
-        seq_val = eval_expr(expr.seq, env)
-        start = eval_expr(expr.start, env) if expr.start is not None else None
-        stop  = eval_expr(expr.stop, env) if expr.stop is not None else None
-        step  = eval_expr(expr.step, env) if expr.step is not None else None
+    return ev
+
+def _compile_slice(expr: SliceIndex, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    seq_ev = compile_expr(expr.seq, scope, ctx)
+    start_ev = compile_expr(expr.start, scope, ctx) if expr.start is not None else None
+    stop_ev  = compile_expr(expr.stop, scope, ctx) if expr.stop is not None else None
+    step_ev  = compile_expr(expr.step, scope, ctx) if expr.step is not None else None
+
+    def ev(env):
+        seq_val = seq_ev(env)
+        start = start_ev(env) if start_ev is not None else None
+        stop  = stop_ev(env) if stop_ev is not None else None
+        step  = step_ev(env) if step_ev is not None else None
         try:
             return seq_val[slice(start, stop, step)]
         except Exception as e:
             raise RuntimeError(f"slice error: {e}")
-    if isinstance(expr, Attr):
-        obj = eval_expr(expr.obj, env)
-        name = expr.name
+    return ev
+
+def _compile_attr(expr: Attr, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    obj_ev = compile_expr(expr.obj, scope, ctx)
+    name = expr.name
+
+    def ev(env):
+        obj = obj_ev(env)
         if isinstance(obj, InstanceObject):
             if name in obj.fields:
                 return obj.fields[name]
@@ -1542,232 +2075,448 @@ def eval_expr(expr, env):
                 return m_env.classes[name]
             raise RuntimeError(f"module attribute {name} not found")
         raise RuntimeError("attribute access only supported on objects")
-    if isinstance(expr, MethodCall):
-        obj = eval_expr(expr.obj, env)
-        name = expr.name
-                # --------------------
-        # STRING METHODS
-        # --------------------
-        if isinstance(obj, str):
-            if expr.kwargs:
-                raise RuntimeError("string methods do not support keyword args")
-            args = [eval_expr(a, env) for a in expr.args]
-
-            if name == "replace":
-                if len(args) != 2:
-                    raise RuntimeError("str.replace needs 2 args")
-                return obj.replace(args[0], args[1])
-
-            if name == "upper":
-                if args:
-                    raise RuntimeError("str.upper takes no args")
-                return obj.upper()
-
-            if name == "lower":
-                if args:
-                    raise RuntimeError("str.lower takes no args")
-                return obj.lower()
-
-            if name == "split":
-                if len(args) > 1:
-                    raise RuntimeError("str.split takes 0 or 1 arg")
-                return obj.split(*args)
-
-            raise RuntimeError(f"unsupported string method {name}")
-
-        if isinstance(obj, list):
-            if expr.kwargs:
-                raise RuntimeError("list methods do not support keyword args")
-            args = [eval_expr(a, env) for a in expr.args]
-            if name == "append":
-                if len(args) != 1:
-                    raise RuntimeError("list.append needs 1 arg")
-                obj.append(args[0])
-                return None
-            if name == "pop":
-                if len(args) == 0:
-                    return obj.pop()
-                if len(args) == 1:
-                    return obj.pop(args[0])
-                raise RuntimeError("list.pop takes at most 1 arg")
-            if name == "sort":
-                if len(args) != 0:
-                    raise RuntimeError("list.sort takes no args")
-                obj.sort()
-                return None
-            raise RuntimeError(f"unsupported list method {name}")
-        if isinstance(obj, dict):
-            if expr.kwargs:
-                raise RuntimeError("dict methods do not support keyword args")
-            args = [eval_expr(a, env) for a in expr.args]
-            if name == "keys":
-                if args:
-                    raise RuntimeError("dict.keys takes no args")
-                return list(obj.keys())
-            if name == "values":
-                if args:
-                    raise RuntimeError("dict.values takes no args")
-                return list(obj.values())
-            if name == "items":
-                if args:
-                    raise RuntimeError("dict.items takes no args")
-                return list(obj.items())
-            if name == "get":
-                if len(args) != 1:
-                    raise RuntimeError("dict.get needs 1 arg")
-                return obj.get(args[0])
-            raise RuntimeError(f"unsupported dict method {name}")
-        if isinstance(obj, InstanceObject):
-            fn = class_lookup_method(obj.cls, name)
-            if fn is None:
-                raise RuntimeError(f"unknown method {name} on {obj.cls.name}")
-            return call_method(obj, fn, expr.args, expr.kwargs, env)
+    return ev
+
+# methods on builtin values: handler(obj, args) per name, looked up per
+# receiver type when the call site is compiled
+
+def _str_replace(obj, args):
+    if len(args) != 2:
+        raise RuntimeError("str.replace needs 2 args")
+    return obj.replace(args[0], args[1])
+
+def _str_upper(obj, args):
+    if args:
+        raise RuntimeError("str.upper takes no args")
+    return obj.upper()
+
+def _str_lower(obj, args):
+    if args:
+        raise RuntimeError("str.lower takes no args")
+    return obj.lower()
+
+def _str_split(obj, args):
+    if len(args) > 1:
+        raise RuntimeError("str.split takes 0 or 1 arg")
+    return obj.split(*args)
+
+def _list_append(obj, args):
+    if len(args) != 1:
+        raise RuntimeError("list.append needs 1 arg")
+    obj.append(args[0])
+
+def _list_pop(obj, args):
+    if len(args) == 0:
+        return obj.pop()
+    if len(args) == 1:
+        return obj.pop(args[0])
+    raise RuntimeError("list.pop takes at most 1 arg")
+
+def _list_sort(obj, args):
+    if len(args) != 0:
+        raise RuntimeError("list.sort takes no args")
+    obj.sort()
+
+def _dict_keys(obj, args):
+    if args:
+        raise RuntimeError("dict.keys takes no args")
+    return list(obj.keys())
+
+def _dict_values(obj, args):
+    if args:
+        raise RuntimeError("dict.values takes no args")
+    return list(obj.values())
+
+def _dict_items(obj, args):
+    if args:
+        raise RuntimeError("dict.items takes no args")
+    return list(obj.items())
+
+def _dict_get(obj, args):
+    if len(args) != 1:
+        raise RuntimeError("dict.get needs 1 arg")
+    return obj.get(args[0])
+
+# receiver type -> (name used in error messages, methods)
+BUILTIN_METHODS = {
+    str: ("string", {
+        "replace": _str_replace,
+        "upper":   _str_upper,
+        "lower":   _str_lower,
+        "split":   _str_split,
+    }),
+    list: ("list", {
+        "append": _list_append,
+        "pop":    _list_pop,
+        "sort":   _list_sort,
+    }),
+    dict: ("dict", {
+        "keys":   _dict_keys,
+        "values": _dict_values,
+        "items":  _dict_items,
+        "get":    _dict_get,
+    }),
+}
+
+def _compile_method_call(expr: MethodCall, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    obj_ev = compile_expr(expr.obj, scope, ctx)
+    name = expr.name
+    args_ev, kwargs_ev = compile_args(expr.args, expr.kwargs, scope, ctx)
+    # the name is fixed, so each builtin receiver type resolves to one
+    # handler (or None) here instead of comparing names on every call
+    builtins = {tp: (label, methods.get(name)) for tp, (label, methods) in BUILTIN_METHODS.items()}
+    # inline cache: the class this call site saw last and what name resolved to
+    cache = [None, None]
+
+    def ev(env):
+        obj = obj_ev(env)
+        t = type(obj)
+        if t is InstanceObject:
+            cls = obj.cls
+            if cls is cache[0]:
+                fn = cache[1]
+            else:
+                fn = cls.resolved_methods.get(name)
+                if fn is None:
+                    raise RuntimeError(f"unknown method {name} on {cls.name}")
+                cache[0] = cls
+                cache[1] = fn
+            return call_method(obj, fn, args_ev, kwargs_ev, env)
+        entry = builtins.get(t)
+        if entry is not None:
+            label, method = entry
+            if kwargs_ev:
+                raise RuntimeError(f"{label} methods do not support keyword args")
+            args = [a(env) for a in args_ev]
+            if method is None:
+                raise RuntimeError(f"unsupported {label} method {name}")
+            return method(obj, args)
         if isinstance(obj, ModuleObject):
             fn = obj.env.funcs.get(name)
             if fn is None:
                 raise RuntimeError(f"unknown function {name} in module {obj.name}")
-            return call_function(fn, expr.args, expr.kwargs, env)
+            return call_function(fn, args_ev, kwargs_ev, env)
         raise RuntimeError(f"method {name} not supported on type {type(obj).__name__}")
-    if isinstance(expr, BinOp):
-        left = eval_expr(expr.left, env)
-        right = eval_expr(expr.right, env)
-        op = expr.op
+    return ev
+
+def _compile_unary(expr: UnaryOp, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    operand = compile_expr(expr.operand, scope, ctx)
+
+    def ev(env):
+        val = operand(env)
+        if type(val) is int:
+            return -val
+        # same result (or error) as the old -1 * x rewrite
+        return _op_mul(-1, val)
+    return ev
+
+def _compile_binop(expr: BinOp, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    fn = expr.fn
+    op = expr.op
+    left = compile_expr(expr.left, scope, ctx)
+    right = compile_expr(expr.right, scope, ctx)
+
+    # a string literal on either side of + always concatenates
+    if op == "+" and type(expr.right) is StringLit:
+        text = expr.right.value
+
+        def ev(env):
+            l = left(env)
+            return (l if type(l) is str else str(l)) + text
+        return ev
+    if op == "+" and type(expr.left) is StringLit:
+        text = expr.left.value
+
+        def ev(env):
+            r = right(env)
+            return text + (r if type(r) is str else str(r))
+        return ev
+
+    # int op int is the common case: do it inline, anything else (str/list
+    # operands, type errors) goes through the generic operator function
+    if op == "+":
+        def ev(env):
+            l = left(env)
+            r = right(env)
+            if type(l) is int and type(r) is int:
+                return l + r
+            return fn(l, r)
+    elif op == "-":
+        def ev(env):
+            l = left(env)
+            r = right(env)
+            if type(l) is int and type(r) is int:
+                return l - r
+            return fn(l, r)
+    elif op == "*":
+        def ev(env):
+            l = left(env)
+            r = right(env)
+            if type(l) is int and type(r) is int:
+                return l * r
+            return fn(l, r)
+    elif op == "%":
+        def ev(env):
+            l = left(env)
+            r = right(env)
+            if type(l) is int and type(r) is int:
+                return l % r
+            return fn(l, r)
+    else:
+        def ev(env):
+            return fn(left(env), right(env))
+    return ev
+
+# --------------------
+# builtin calls, resolved by name at compile time
+# --------------------
+
+def _compile_range(expr: Call, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    if len(expr.args) != 1 or expr.kwargs:
+        return _raise_at_runtime("range() supports exactly 1 positional arg here")
+    stop = expr.args[0]
+    if type(stop) is IntLit:
+        # range objects are immutable, so a literal bound can share one
+        r = range(stop.value)
+
+        def ev_const(env):
+            return r
+        return ev_const
+    stop_ev = compile_expr(stop, scope, ctx)
+
+    def ev(env):
+        n = stop_ev(env)
+        return range(n if type(n) is int else int(n))
+    return ev
+
+def _compile_len(expr: Call, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    if len(expr.args) != 1 or expr.kwargs:
+        return _raise_at_runtime("len() needs 1 positional argument")
+    arg_ev = compile_expr(expr.args[0], scope, ctx)
+
+    def ev(env):
+        val = arg_ev(env)
+        try:
+            return len(val)
+        except TypeError:
+            raise RuntimeError("object has no len()")
+    return ev
+
+def _compile_enumerate(expr: Call, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    if expr.kwargs or len(expr.args) not in (1, 2):
+        return _raise_at_runtime("enumerate() takes 1 or 2 positional args and no kwargs")
+    seq_ev = compile_expr(expr.args[0], scope, ctx)
+    start_ev = compile_expr(expr.args[1], scope, ctx) if len(expr.args) == 2 else None
+
+    def ev(env):
+        seq = seq_ev(env)
+        start = 0
+        if start_ev is not None:
+            start = int(start_ev(env))
+        return list(enumerate(seq, start))
+    return ev
+
+def _compile_zip(expr: Call, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    if expr.kwargs or len(expr.args) < 1:
+        return _raise_at_runtime("zip() needs at least 1 positional arg and no kwargs")
+    args_ev = tuple(compile_expr(a, scope, ctx) for a in expr.args)
+
+    def ev(env):
+        iterables = [a(env) for a in args_ev]
+        return list(zip(*iterables))
+    return ev
+
+def _compile_list_call(expr: Call, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    if expr.kwargs:
+        return _raise_at_runtime("list() takes only positional arguments")
+    if len(expr.args) == 0:
+        def ev_empty(env):
+            return []
+        return ev_empty
+    if len(expr.args) != 1:
+        return _raise_at_runtime("list() takes at most 1 argument")
+    it_ev = compile_expr(expr.args[0], scope, ctx)
+
+    def ev(env):
+        it = it_ev(env)
+        try:
+            return list(it)
+        except Exception:
+            raise RuntimeError("object not iterable for list()")
+    return ev
+
+BUILTIN_COMPILERS: dict[str, Callable[..., ExprCode]] = {
+    "range":     _compile_range,
+    "len":       _compile_len,
+    "enumerate": _compile_enumerate,
+    "zip":       _compile_zip,
+    "list":      _compile_list_call,
+}
 
-        if op == "+":
-            if isinstance(left, str) or isinstance(right, str):
-                return str(left) + str(right)
-            if isinstance(left, list) and isinstance(right, list):
-                return left + right
-            if isinstance(left, int) and isinstance(right, int):
-                return left + right
-            raise RuntimeError(f"unsupported + between {type(left).__name__} and {type(right).__name__}")
-
-        if op == "-":
-            if isinstance(left, int) and isinstance(right, int):
-                return left - right
-            raise RuntimeError(f"unsupported - between {type(left).__name__} and {type(right).__name__}")
-
-        if op == "*":
-            if isinstance(left, int) and isinstance(right, int):
-                return left * right
-            if isinstance(left, str) and isinstance(right, int):
-                return left * right
-            if isinstance(left, list) and isinstance(right, int):
-                return left * right
-            raise RuntimeError(f"unsupported * between {type(left).__name__} and {type(right).__name__}")
+def _compile_call(expr: Call, scope: dict[str, int] | None, ctx: CompileCtx) -> ExprCode:
+    builtin = BUILTIN_COMPILERS.get(expr.name)
+    if builtin is not None:
+        return builtin(expr, scope, ctx)
 
-        if op == "/":
-            if isinstance(left, int) and isinstance(right, int):
-                return left // right
-            raise RuntimeError(f"unsupported / between {type(left).__name__} and {type(right).__name__}")
-
-        if op == "%":
-            if isinstance(left, int) and isinstance(right, int):
-                return left % right
-            raise RuntimeError(f"unsupported % between {type(left).__name__} and {type(right).__name__}")
-
-        if op in ("<", ">", "<=", ">=", "==", "!="):
-            if op == "<": return left < right
-            if op == ">": return left > right
-            if op == "<=": return left <= right
-            if op == ">=": return left >= right
-            if op == "==": return left == right
-            if op == "!=": return left != right
-
-        raise RuntimeError(f"unsupported operator {op}")
-
-    if isinstance(expr, Call):
-
-        if expr.name == "range":
-            if len(expr.args) != 1 or expr.kwargs:
-                raise RuntimeError("range() supports exactly 1 positional arg here")
-            stop = eval_expr(expr.args[0], env)
-            return range(int(stop))
-
-        if expr.name == "len":
-            if len(expr.args) != 1 or expr.kwargs:
-                raise RuntimeError("len() needs 1 positional argument")
-            val = eval_expr(expr.args[0], env)
-            try:
-                return len(val)
-            except TypeError:
-                raise RuntimeError("object has no len()")
-
-        if expr.name == "enumerate":
-            if expr.kwargs or len(expr.args) not in (1, 2):
-                raise RuntimeError("enumerate() takes 1 or 2 positional args and no kwargs")
-            seq = eval_expr(expr.args[0], env)
-            start = 0
-            if len(expr.args) == 2:
-                start = int(eval_expr(expr.args[1], env))
-            return list(enumerate(seq, start))
-
-        if expr.name == "zip":
-            if expr.kwargs or len(expr.args) < 1:
-                raise RuntimeError("zip() needs at least 1 positional arg and no kwargs")
-            iterables = [eval_expr(a, env) for a in expr.args]
-            return list(zip(*iterables))
-
-        # --------------------
-        # NEW BUILTIN: list()
-        # --------------------
-        if expr.name == "list":
-            if expr.kwargs:
-                raise RuntimeError("list() takes only positional arguments")
-            if len(expr.args) == 0:
-                return []
-            if len(expr.args) == 1:
-                it = eval_expr(expr.args[0], env)
-                try:
-                    return list(it)
-                except Exception:
-                    raise RuntimeError("object not iterable for list()")
-            raise RuntimeError("list() takes at most 1 argument")
-
-        # fallthrough to user-defined fn/class/var
+    name = expr.name
+    args_ev, kwargs_ev = compile_args(expr.args, expr.kwargs, scope, ctx)
+    # a name only ever bound by one top-level def always resolves to that
+    # def's function once it has run, so the lookup can be done once
+    target = [None] if name in ctx.stable_funcs else None
+
+    # user-defined fn/class/var
+    def ev(env):
         try:
-            fn = env.get_func(expr.name)
-            return call_function(fn, expr.args, expr.kwargs, env)
+            if target is None:
+                fn = env.get_func(name)
+            else:
+                fn = target[0]
+                if fn is None:
+                    fn = target[0] = env.get_func(name)
+            return call_function(fn, args_ev, kwargs_ev, env)
         except NameError:
             pass
 
         try:
-            cls = env.get_class(expr.name)
-            return call_class(cls, expr.args, expr.kwargs, env)
+            cls = env.get_class(name)
+            return call_class(cls, args_ev, kwargs_ev, env)
         except NameError:
             pass
 
         try:
-            val = env.get_var(expr.name)
+            val = env.get_var(name)
             if isinstance(val, FunctionObject):
-                return call_function(val, expr.args, expr.kwargs, env)
+                return call_function(val, args_ev, kwargs_ev, env)
             if isinstance(val, ClassObject):
-                return call_class(val, expr.args, expr.kwargs, env)
+                return call_class(val, args_ev, kwargs_ev, env)
         except NameError:
             pass
 
-        raise NameError(f"undefined function or class or variable {expr.name}")
-
-    raise RuntimeError("unknown expression")
+        raise NameError(f"undefined function or class or variable {name}")
+    return ev
+
+def stable_function_names(stmts: tuple) -> frozenset:
+    # top-level defs whose name is bound nowhere else in the program: no
+    # assignment, parameter, loop/with/comprehension variable, class, method,
+    # import or nonlocal anywhere uses it
+    counts: dict[str, int] = {}
+    _count_bindings(stmts, counts)
+    return frozenset(
+        s.name for s in stmts
+        if type(s) is FuncDef and counts[s.name] == 1
+    )
+
+def _count_bindings(node, counts):
+    if isinstance(node, (list, tuple)):
+        for item in node:
+            _count_bindings(item, counts)
+        return
+    if isinstance(node, dict):
+        for item in node.values():
+            _count_bindings(item, counts)
+        return
+    if not hasattr(node, "__dataclass_fields__"):
+        return
+    t = type(node)
+    names = ()
+    if t is Assign or t is FuncDef or t is ClassDef:
+        names = (node.name,)
+    elif t in (ForStmt, ListComp, DictComp, GenExpr):
+        names = (node.var,)
+    elif t is WithStmt and node.var is not None:
+        names = (node.var,)
+    elif t is ImportStmt:
+        names = (node.module,)
+    elif t is NonlocalStmt:
+        names = node.names
+    elif t is LambdaExpr:
+        names = node.params[0]
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    if t is FuncDef:
+        for name in node.params:
+            counts[name] = counts.get(name, 0) + 1
+        if node.vararg is not None:
+            counts[node.vararg] = counts.get(node.vararg, 0) + 1
+    for f in fields(node):
+        _count_bindings(getattr(node, f.name), counts)
+
+def compile_module(stmts: tuple) -> StmtCode:
+    # compile_block for a whole program or imported module
+    return compile_block(stmts, None, CompileCtx(stable_function_names(stmts)))
+
+EXPR_COMPILERS: dict[type, Callable[..., ExprCode]] = {
+    IntLit:     _compile_literal,
+    StringLit:  _compile_literal,
+    ListLit:    _compile_list_lit,
+    ListComp:   _compile_list_comp,
+    DictLit:    _compile_dict_lit,
+    DictComp:   _compile_dict_comp,
+    GenExpr:    _compile_gen_expr,
+    LambdaExpr: _compile_lambda,
+    AwaitExpr:  _compile_await,
+    Var:        _compile_var,
+    Index:      _compile_index,
+    SliceIndex: _compile_slice,
+    Attr:       _compile_attr,
+    MethodCall: _compile_method_call,
+    BinOp:      _compile_binop,
+    UnaryOp:    _compile_unary,
+    Call:       _compile_call,
+}
 
 # =========================
 # JIT helpers
 # =========================
 
-def can_jit_expr(expr, params):
+# ops that mean the same thing in the language and in Python on ints
+JIT_BINOPS = frozenset(("+", "-", "*", "/", "%", "<", ">", "<=", ">=", "==", "!="))
+
+# returned by a jitted function when it can't handle the call: a non-int
+# argument, or any error while running. The jitted code only touches its own
+# locals, so the interpreter can rerun the call from scratch.
+NO_JIT = object()
+
+def can_jit_expr(expr, names):
     if isinstance(expr, IntLit):
         return True
     if isinstance(expr, Var):
-        return expr.name in params
-    if isinstance(expr, BinOp) and expr.op in ("+", "-", "*", "/"):
-        return can_jit_expr(expr.left, params) and can_jit_expr(expr.right, params)
+        return expr.name in names
+    if isinstance(expr, BinOp) and expr.op in JIT_BINOPS:
+        return can_jit_expr(expr.left, names) and can_jit_expr(expr.right, names)
+    if isinstance(expr, UnaryOp):
+        return can_jit_expr(expr.operand, names)
+    return False
+
+def can_jit_stmt(stmt, names, in_loop):
+    t = type(stmt)
+    if t is Assign:
+        return stmt.name in names and can_jit_expr(stmt.expr, names)
+    if t is ReturnStmt:
+        return can_jit_expr(stmt.expr, names)
+    if t is IfStmt:
+        return can_jit_expr(stmt.cond, names) and can_jit_block(stmt.body, names, in_loop)
+    if t is WhileStmt:
+        return can_jit_expr(stmt.cond, names) and can_jit_block(stmt.body, names, True)
+    if t is ForStmt:
+        it = stmt.iterable
+        return (
+            isinstance(it, Call) and it.name == "range" and len(it.args) == 1 and not it.kwargs
+            and can_jit_expr(it.args[0], names)
+            and can_jit_block(stmt.body, names, True)
+        )
+    if t is BreakStmt or t is ContinueStmt:
+        return in_loop
     return False
 
+def can_jit_block(stmts, names, in_loop):
+    return all(can_jit_stmt(s, names, in_loop) for s in stmts)
+
 def emit_python_expr(expr):
     if isinstance(expr, IntLit):
-        return str(expr.value)
+        return str(expr.value) if expr.value >= 0 else f"({expr.value})"
     if isinstance(expr, Var):
-        return expr.name
+        return f"v_{expr.name}"
     if isinstance(expr, BinOp):
         left = emit_python_expr(expr.left)
         right = emit_python_expr(expr.right)
@@ -1775,39 +2524,70 @@ def emit_python_expr(expr):
         if op == "/":
             op = "//"
         return f"({left} {op} {right})"
+    if isinstance(expr, UnaryOp):
+        return f"(-{emit_python_expr(expr.operand)})"
     raise RuntimeError("unsupported expression for JIT")
 
-def maybe_jit_compile(fn):
-    if fn.jit_impl is not None:
-        return
-    if fn.defaults or fn.vararg is not None:
-        return
-    if len(fn.body) != 1 or not isinstance(fn.body[0], ReturnStmt):
+def emit_python_block(stmts, indent, lines):
+    pad = "    " * indent
+    if not stmts:
+        lines.append(f"{pad}pass")
+    for stmt in stmts:
+        t = type(stmt)
+        if t is Assign:
+            lines.append(f"{pad}v_{stmt.name} = {emit_python_expr(stmt.expr)}")
+        elif t is ReturnStmt:
+            lines.append(f"{pad}return {emit_python_expr(stmt.expr)}")
+        elif t is IfStmt:
+            lines.append(f"{pad}if {emit_python_expr(stmt.cond)}:")
+            emit_python_block(stmt.body, indent + 1, lines)
+        elif t is WhileStmt:
+            lines.append(f"{pad}while {emit_python_expr(stmt.cond)}:")
+            emit_python_block(stmt.body, indent + 1, lines)
+        elif t is ForStmt:
+            stop = emit_python_expr(stmt.iterable.args[0])
+            lines.append(f"{pad}for v_{stmt.var} in range({stop}):")
+            emit_python_block(stmt.body, indent + 1, lines)
+        elif t is BreakStmt:
+            lines.append(f"{pad}break")
+        elif t is ContinueStmt:
+            lines.append(f"{pad}continue")
+        else:
+            raise RuntimeError("unsupported statement for JIT")
+
+def maybe_jit_compile(fn: FunctionObject) -> None:
+    if fn.defaults or fn.vararg is not None or fn.is_async or fn.has_yield:
         return
-    expr = fn.body[0].expr
-    if not can_jit_expr(expr, fn.params):
+    if not can_jit_block(fn.body, fn.local_names, False):
         return
-    expr_code = emit_python_expr(expr)
-    params_code = ", ".join(fn.params)
-    src = f"lambda {params_code}: {expr_code}"
+    params = [f"v_{p}" for p in fn.params]
+    lines = [f"def jit_fn({', '.join(params)}):"]
+    if params:
+        lines.append(f"    if {' or '.join(f'type({p}) is not int' for p in params)}:")
+        lines.append("        return NO_JIT")
+    lines.append("    try:")
+    emit_python_block(fn.body, 2, lines)
+    lines.append("    except Exception:")
+    lines.append("        return NO_JIT")
+    ns: dict[str, Any] = {"NO_JIT": NO_JIT}
     try:
-        fn.jit_impl = eval(src, {})
+        exec(compile("\n".join(lines) + "\n", f"<jit {fn.name}>", "exec"), ns)
     except Exception:
-        fn.jit_impl = None
+        return
+    fn.jit_impl = ns["jit_fn"]
 
 # =========================
 # Callers (functions / methods / classes)
 # =========================
 
-def _invoke_function(fn, pos_values, kw_values):
+def _invoke_function(fn: FunctionObject, pos_values: list, kw_values: dict) -> object:
     global CURRENT_OUT
 
     fn.call_count += 1
-    if fn.call_count >= JIT_THRESHOLD and fn.jit_impl is None:
+    if fn.call_count == JIT_THRESHOLD:
         maybe_jit_compile(fn)
 
     param_names = fn.params
-    annotations = fn.annotations or {}
     defaults = fn.defaults or {}
 
     bindings = {}
@@ -1838,75 +2618,76 @@ def _invoke_function(fn, pos_values, kw_values):
         bad = next(iter(kw_values.keys()))
         raise RuntimeError(f"{fn.name} got unexpected keyword arg {bad}")
 
-    for name, val in bindings.items():
-        if fn.is_method and fn.params and name == fn.params[0]:
+    for name, tp, expected_type_name in fn.param_checks:
+        if fn.is_method and name == param_names[0]:
             continue
-        expected_type_name = annotations.get(name)
-        if expected_type_name is not None:
-            tp = TYPE_MAP.get(expected_type_name)
-            if tp is not None and not isinstance(val, tp):
-                raise RuntimeError(
-                    f"type error in call to {fn.name}: param {name} expected {expected_type_name}, got {type(val).__name__}"
-                )
-
-    if fn.jit_impl is not None and fn.vararg is None and not defaults and not fn.is_async:
-        ordered = [bindings[name] for name in param_names]
-        return fn.jit_impl(*ordered)
-
-    local = Env(parent=fn.env)
+        val = bindings[name]
+        if not isinstance(val, tp):
+            raise RuntimeError(
+                f"type error in call to {fn.name}: param {name} expected {expected_type_name}, got {type(val).__name__}"
+            )
+
+    if fn.jit_impl is not None:
+        result = fn.jit_impl(*[bindings[name] for name in param_names])
+        if result is not NO_JIT:
+            return result
+
+    pool = fn.frame_pool
+    if pool:
+        local = pool.pop()
+    else:
+        local = Frame(fn.local_names, parent=fn.env)
     for name, val in bindings.items():
         local.set_var(name, val)
     local.yield_values = []
 
-    has_yield = False
-    for stmt in fn.body:
-        if isinstance(stmt, YieldStmt):
-            has_yield = True
-            break
-
-    try:
-        if has_yield:
-            eval_block(fn.body, local, CURRENT_OUT)
-            return list(local.yield_values)
-
-        eval_block(fn.body, local, CURRENT_OUT)
-        return None
-
-    except ReturnException as r:
+    signal = fn.code(local, CURRENT_OUT)
+    if signal is RETURN:
         if local.yield_values:
-            return list(local.yield_values)
-        return r.value
-
-def call_function(fn, args_exprs, kwargs_exprs, env):
-    pos_values = [eval_expr(a, env) for a in args_exprs]
+            result = list(local.yield_values)
+        else:
+            result = local.return_value
+    elif signal is not None:
+        raise RuntimeError(SIGNAL_ERRORS[signal])
+    elif fn.has_yield:
+        result = list(local.yield_values)
+    else:
+        result = None
+    if pool is not None:
+        local.reset()
+        pool.append(local)
+    return result
+
+def call_function(fn: FunctionObject, args: tuple, kwargs: tuple, env: Env) -> object:
+    pos_values = [a(env) for a in args]
     kw_values = {}
-    for key, expr_arg in kwargs_exprs:
+    for key, arg in kwargs:
         if key in kw_values:
             raise RuntimeError(f"duplicate keyword argument {key} in call to {fn.name}")
-        kw_values[key] = eval_expr(expr_arg, env)
+        kw_values[key] = arg(env)
     return _invoke_function(fn, pos_values, kw_values)
 
-def call_method(instance, fn, args_exprs, kwargs_exprs, env):
-    pos_values = [instance] + [eval_expr(a, env) for a in args_exprs]
+def call_method(instance: InstanceObject, fn: FunctionObject, args: tuple, kwargs: tuple, env: Env) -> object:
+    pos_values = [instance] + [a(env) for a in args]
     kw_values = {}
-    for key, expr_arg in kwargs_exprs:
+    for key, arg in kwargs:
         if key in kw_values:
             raise RuntimeError(f"duplicate keyword argument {key} in call to {fn.name}")
-        kw_values[key] = eval_expr(expr_arg, env)
+        kw_values[key] = arg(env)
     return _invoke_function(fn, pos_values, kw_values)
 
-def call_class(cls, args_exprs, kwargs_exprs, env):
+def call_class(cls: ClassObject, args: tuple, kwargs: tuple, env: Env) -> InstanceObject:
     inst = InstanceObject(cls, fields=dict(cls.attributes))
     init = class_lookup_method(cls, "__init__")
     if init is not None:
-        call_method(inst, init, args_exprs, kwargs_exprs, env)
+        call_method(inst, init, args, kwargs, env)
     return inst
 
 # =========================
 # Import system
 # =========================
 
-def import_module(name, env):
+def import_module(name: str, env: Env) -> None:
     global CURRENT_OUT
     if name in MODULE_CACHE:
         env.set_var(name, MODULE_CACHE[name])
@@ -1917,13 +2698,15 @@ def import_module(name, env):
     except FileNotFoundError:
         raise RuntimeError(f"cannot import {name}: {path} not found")
     tokens = lex(src)
-    parser = Parser(tokens)
+    parser = Parser(tokens, memoize=PACKRAT)
     prog = parser.parse_program()
     module_env = Env()
-    module_out = []
+    module_out = bytearray()
     prev_out = CURRENT_OUT
     CURRENT_OUT = module_out
-    eval_block(prog.stmts, module_env, module_out)
+    signal = compile_module(prog.stmts)(module_env, module_out)
+    if signal is not None:
+        raise RuntimeError(SIGNAL_ERRORS[signal])
     CURRENT_OUT = prev_out
     mod = ModuleObject(name, module_env)
     MODULE_CACHE[name] = mod
@@ -1933,30 +2716,76 @@ def import_module(name, env):
 # Main
 # =========================
 
+def write_image(fd, code, msg):
+    # size the file up front and assemble the image directly in the
+    # page cache instead of building it in memory and write()ing it
+    total = elf64_size(msg)
+    os.ftruncate(fd, total)
+    with mmap.mmap(fd, total) as mm:
+        elf64_into(mm, code, msg)
+
+def exec_in_memory(code, msg):
+    # run the image from an anonymous memory file, it never touches disk.
+    # Returns only if that is not possible here (no memfd_create, no /proc
+    # or exec from it not allowed), so the caller can fall back to a file
+    try:
+        fd = os.memfd_create("pasmhon", os.MFD_CLOEXEC)
+    except (AttributeError, OSError):
+        return
+    try:
+        write_image(fd, code, msg)
+        path = f"/proc/self/fd/{fd}"
+        os.execv(path, [path])
+    except OSError:
+        os.close(fd)
+
 def main():
-    if len(sys.argv) != 2:
-        print("usage: pathon main.pa")
+    global PACKRAT
+    args = sys.argv[1:]
+    out_path = None
+    while args and args[0].startswith("--"):
+        flag = args.pop(0)
+        if flag == "--output" and args:
+            out_path = args.pop(0)
+        elif flag == "--packrat":
+            PACKRAT = True
+        else:
+            # unknown flag, or --output with no value
+            args = []
+    if len(args) != 1:
+        print("usage: pathon [--output path] [--packrat] main.pa")
         sys.exit(1)
 
-    src = open(sys.argv[1]).read()
+    src = open(args[0]).read()
     tokens = lex(src)
-    parser = Parser(tokens)
+    parser = Parser(tokens, memoize=PACKRAT)
     prog = parser.parse_program()
 
-    out_text = eval_program(prog)
-    msg = out_text.encode()
+    msg = literal_output(prog)
+    if msg is None:
+        msg = eval_program(prog)
 
     code = build_print(msg)
-    binfile = elf64(code, msg)
 
-    os.makedirs("build", exist_ok=True)
-    out_path = "build/main"
-    open(out_path, "wb").write(binfile)
-    os.chmod(out_path, 0o755)
+    # replace this process with the binary: its output and exit status
+    # go straight to our caller, no pipe or fork in between
+    sys.stdout.flush()
+    sys.stderr.flush()
 
-    proc = subprocess.run([out_path], capture_output=True, text=True)
-    print(proc.stdout, end="")
-    sys.exit(proc.returncode)
+    if out_path is None:
+        exec_in_memory(code, msg)
+        out_path = "build/main"
+
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    fd = os.open(out_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o755)
+    try:
+        write_image(fd, code, msg)
+    finally:
+        os.close(fd)
+    os.chmod(out_path, 0o755)
+    os.execv(out_path, [out_path])
 
 if __name__ == "__main__":
     main()